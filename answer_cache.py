@@ -0,0 +1,157 @@
+# answer_cache.py
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class _Entry:
+    scope: Tuple[str, ...]
+    text_key: str
+    embedding: np.ndarray
+    answer: str
+    created: float
+
+
+class AnswerCache:
+    # In-memory cache of generated answers, looked up first by normalised
+    # query text and then by query-embedding cosine similarity. Answers are
+    # keyed by scope, the tuple of namespaces the answer was retrieved from.
+    # Each namespace carries a version counter; invalidate() bumps it and
+    # drops every answer whose scope includes that namespace, and put()
+    # ignores answers computed against older versions, so nothing generated
+    # before an ingest is served after it by this process. The cache and its
+    # versions are per-process: another replica only notices the ingest once
+    # its own entries expire, which is why the TTL defaults to five minutes.
+    def __init__(self, threshold: float = None, ttl: float = None, max_entries: int = None):
+        self.logger = logging.getLogger(__name__)
+        self.threshold = threshold or float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl = ttl or float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "300"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()  # LRU order, oldest first
+        self._text_index: Dict[tuple, int] = {}
+        self._versions: Dict[str, int] = {}
+        self._matrices: Dict[tuple, tuple] = {}  # scope -> (entry ids, stacked embeddings)
+        self._next_id = 0
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def normalise(query: str) -> str:
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def version(self, scope: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self._versions.get(namespace, 0) for namespace in scope)
+
+    def invalidate(self, namespace: str):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            for entry_id in [i for i, e in self._entries.items() if namespace in e.scope]:
+                self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        self._text_index.pop((entry.scope, entry.text_key), None)
+        self._matrices.pop(entry.scope, None)
+
+    def _hit(self, entry_id: int) -> Optional[str]:
+        entry = self._entries[entry_id]
+        if time.monotonic() - entry.created > self.ttl:
+            self._remove(entry_id)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(entry_id)
+        self.hits += 1
+        return entry.answer
+
+    def get_text(self, scope: Tuple[str, ...], query: str) -> Optional[str]:
+        # Exact (normalised) repeat of an earlier question; no embedding needed.
+        # Doesn't count a miss, get() is always called after a text miss.
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry_id = self._text_index.get((scope, self.normalise(query)))
+            return self._hit(entry_id) if entry_id is not None else None
+
+    def _matrix(self, scope: Tuple[str, ...]):
+        matrix = self._matrices.get(scope)
+        if matrix is None:
+            ids = [i for i, e in self._entries.items() if e.scope == scope]
+            vectors = np.stack([self._entries[i].embedding for i in ids]) if ids else None
+            matrix = self._matrices[scope] = (ids, vectors)
+        return matrix
+
+    def get(self, scope: Tuple[str, ...], embedding: List[float]) -> Optional[str]:
+        if not self.enabled:
+            return None
+        query = self._unit(embedding)
+        with self._lock:
+            ids, vectors = self._matrix(scope)
+            if vectors is not None:
+                scores = vectors @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    answer = self._hit(ids[best])
+                    if answer is not None:
+                        self.semantic_hits += 1
+                        return answer
+            self.misses += 1
+            return None
+
+    def put(self, scope: Tuple[str, ...], query: str, embedding: List[float], answer: str, version: Tuple[int, ...]):
+        if not self.enabled:
+            return
+        with self._lock:
+            if version != self.version(scope):
+                return
+            text_key = self.normalise(query)
+            existing = self._text_index.get((scope, text_key))
+            if existing is not None:
+                self._remove(existing)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, text_key, self._unit(embedding), answer, time.monotonic())
+            self._text_index[(scope, text_key)] = entry_id
+            self._matrices.pop(scope, None)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "versions": dict(self._versions),
+        }
@@ -0,0 +1,636 @@
+# benchmark.py
+#
+# Offline load test for the API. OpenAI, Pinecone, Notion and Supabase are
+# replaced with deterministic local stand-ins (fake LLM/embeddings/Notion,
+# the local vector store, SQLite) and concurrent clients drive the real
+# FastAPI app in-process. Results are written as JSON so runs from two
+# commits can be compared:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import uuid
+import zlib
+import random
+import shutil
+import asyncio
+import logging
+import contextlib
+import argparse
+import resource
+import tempfile
+import datetime
+import platform
+import subprocess
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List
+
+import numpy as np
+
+SCENARIOS = ["message", "message_stream", "ingest", "chats", "webhook"]
+
+TOPICS = [
+    "billing", "onboarding", "security", "deployment", "pricing", "support",
+    "analytics", "integrations", "permissions", "backups", "latency", "search"
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load test with fake LLM, embeddings, vector store and Notion")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent clients per scenario")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Seconds before the fake LLM's first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=40, help="Tokens per fake LLM answer")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Seconds per fake embedding call")
+    parser.add_argument("--fake-openai-server", action="store_true",
+                        help="Serve the fake LLM/embeddings over HTTP and use the real OpenAI clients and gateway")
+    parser.add_argument("--upstream-slow-rate", type=float, default=0.0, help="Fraction of fake OpenAI calls that are slow")
+    parser.add_argument("--upstream-slow-factor", type=float, default=10.0, help="Latency multiplier for slow calls")
+    parser.add_argument("--upstream-429-rate", type=float, default=0.0, help="Fraction of fake OpenAI calls answered with 429")
+    parser.add_argument("--notion-latency", type=float, default=0.05, help="Seconds per fake Notion API call")
+    parser.add_argument("--notion-rps", type=float, default=3.0, help="Notion client rate limit (requests/second)")
+    parser.add_argument("--notion-pages", type=int, default=20)
+    parser.add_argument("--notion-quiet", type=float, default=0.5, help="Webhook debounce window in seconds")
+    parser.add_argument("--corpus-paragraphs", type=int, default=400, help="Paragraphs ingested before the query scenarios")
+    parser.add_argument("--doc-kb", type=int, default=64, help="Size of each uploaded document in the ingest scenario")
+    parser.add_argument("--seed-chats", type=int, default=500, help="Chats created before the /chats scenario")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the answer cache on (off by default so every query reaches the LLM)")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="Earlier JSON results to print deltas against")
+    parser.add_argument("--keep-data", action="store_true", help="Keep the temporary data directory")
+    return parser.parse_args()
+
+
+def configure_environment(args, data_dir: str):
+    # Must run before any app module is imported: the database engine, the
+    # caches and the Notion rate limiter read these at import time
+    os.environ["SUPABASE_DB"] = f"sqlite+aiosqlite:///{os.path.join(data_dir, 'bench.db')}"
+    os.environ["VECTOR_STORE_BACKEND"] = "local"
+    os.environ["LOCAL_VECTOR_STORE_PATH"] = os.path.join(data_dir, "vectors")
+    os.environ.setdefault("LEXICAL_SEARCH", "1")
+    os.environ["LEXICAL_INDEX_PATH"] = os.path.join(data_dir, "lexical")
+    os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(data_dir, "embedding_cache.db")
+    os.environ["UPLOAD_DIR"] = os.path.join(data_dir, "uploads")
+    os.environ["NOTION_REQUESTS_PER_SECOND"] = str(args.notion_rps)
+    os.environ["NOTION_SYNC_QUIET_SECONDS"] = str(args.notion_quiet)
+    # Fake-embedding similarities aren't on OpenAI's scale, so don't let the
+    # production score cutoff decide whether the LLM is called
+    os.environ["CONTEXT_SCORE_CUTOFF"] = "0"
+    if not args.answer_cache:
+        os.environ["ANSWER_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["NOTION_API_KEY"] = "benchmark"
+    os.environ["NOTION_DATABASE_ID"] = "benchmark"
+    # tiktoken would otherwise download its BPE file; llama_index ships a copy
+    import llama_index
+    os.environ.setdefault(
+        "TIKTOKEN_CACHE_DIR",
+        os.path.join(os.path.dirname(llama_index.__file__), "_static", "tiktoken_cache")
+    )
+
+
+def make_fake_llm(args):
+    from llama_index.llms import CompletionResponse, CustomLLM, LLMMetadata
+    from llama_index.llms.base import llm_completion_callback
+
+    class FakeLLM(CustomLLM):
+        # Answers after `latency` seconds, then emits `tokens` tokens at
+        # `tokens_per_second`. The answer text depends only on the prompt.
+        latency: float = 0.3
+        tokens_per_second: float = 50.0
+        tokens: int = 40
+
+        @property
+        def metadata(self) -> LLMMetadata:
+            return LLMMetadata(context_window=8192, num_output=256, model_name="fake-gpt-4")
+
+        def _words(self, prompt: str) -> List[str]:
+            rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+            return [f"{rng.choice(TOPICS)} " for _ in range(self.tokens)]
+
+        @llm_completion_callback()
+        def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+            time.sleep(self.latency + self.tokens / self.tokens_per_second)
+            return CompletionResponse(text="".join(self._words(prompt)))
+
+        @llm_completion_callback()
+        def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+            time.sleep(self.latency)
+            text = ""
+            for word in self._words(prompt):
+                time.sleep(1.0 / self.tokens_per_second)
+                text += word
+                yield CompletionResponse(text=text, delta=word)
+
+    return FakeLLM(
+        latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        tokens=args.llm_tokens
+    )
+
+
+def hashed_vector(text: str, dim: int = 256) -> List[float]:
+    # Hashed bag of words: deterministic, and texts sharing words land
+    # close together, so retrieval and the answer cache behave sensibly
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def make_fake_embedding(args):
+    from llama_index.embeddings.base import BaseEmbedding
+
+    class FakeEmbedding(BaseEmbedding):
+        latency: float = 0.02
+
+        def _vector(self, text: str) -> List[float]:
+            return hashed_vector(text)
+
+        def _get_query_embedding(self, query: str) -> List[float]:
+            time.sleep(self.latency)
+            return self._vector(query)
+
+        async def _aget_query_embedding(self, query: str) -> List[float]:
+            return self._get_query_embedding(query)
+
+        def _get_text_embedding(self, text: str) -> List[float]:
+            return self._get_text_embeddings([text])[0]
+
+        def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+            time.sleep(self.latency)
+            return [self._vector(text) for text in texts]
+
+    return FakeEmbedding(model_name="fake-embedding", latency=args.embed_latency)
+
+
+class FakeNotion:
+    # Stands in for notion_client.AsyncClient. Every pages.retrieve counts as
+    # an edit: last_edited_time moves and one paragraph of the page changes,
+    # so each webhook does a real incremental re-index.
+    def __init__(self, pages: int, latency: float, seed: int):
+        self.latency = latency
+        self.rng = random.Random(seed)
+        self.pages = {}
+        for i in range(pages):
+            page_id = str(uuid.UUID(int=i + 1))
+            paragraphs = [self._paragraph() for _ in range(12)]
+            self.pages[page_id] = {"version": 0, "paragraphs": paragraphs}
+
+    def _paragraph(self) -> str:
+        return " ".join(self.rng.choice(TOPICS) for _ in range(40)) + "."
+
+    def _page(self, page_id: str) -> dict:
+        state = self.pages[page_id]
+        edited = datetime.datetime(2024, 1, 1) + datetime.timedelta(minutes=state["version"])
+        return {
+            "id": page_id,
+            "created_time": "2024-01-01T00:00:00.000Z",
+            "last_edited_time": edited.isoformat() + ".000Z",
+            "properties": {"title": {"title": [{"plain_text": f"Page {page_id[-4:]}"}]}}
+        }
+
+    def client(self, auth=None):
+        async def call(result):
+            await asyncio.sleep(self.latency)
+            return result
+
+        async def query(database_id, page_size=100, start_cursor=None):
+            return await call({"results": [self._page(page_id) for page_id in self.pages], "has_more": False})
+
+        async def retrieve(page_id):
+            state = self.pages[page_id]
+            state["version"] += 1
+            state["paragraphs"][state["version"] % len(state["paragraphs"])] = self._paragraph()
+            return await call(self._page(page_id))
+
+        async def list_children(block_id, page_size=100, start_cursor=None):
+            paragraphs = self.pages.get(block_id, {"paragraphs": []})["paragraphs"]
+            blocks = [
+                {
+                    "id": f"{block_id}-{i}",
+                    "type": "paragraph",
+                    "has_children": False,
+                    "paragraph": {"rich_text": [{"plain_text": text}]}
+                } for i, text in enumerate(paragraphs)
+            ]
+            return await call({"results": blocks, "has_more": False})
+
+        async def aclose():
+            pass
+
+        return SimpleNamespace(
+            databases=SimpleNamespace(query=query),
+            pages=SimpleNamespace(retrieve=retrieve),
+            blocks=SimpleNamespace(children=SimpleNamespace(list=list_children)),
+            aclose=aclose
+        )
+
+
+def corpus_text(rng: random.Random, paragraphs: int) -> str:
+    return "\n\n".join(
+        " ".join(rng.choice(TOPICS) for _ in range(60)) + "." for _ in range(paragraphs)
+    )
+
+
+class RssSampler:
+    # Peak resident set size while a scenario runs, from /proc when
+    # available; falls back to the process-wide ru_maxrss high-water mark
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    @staticmethod
+    def current() -> int:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self.current())
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc_info):
+        self._task.cancel()
+        self.peak = max(self.peak, self.current())
+
+
+async def drive(clients: int, requests: int, send: Callable[[int], Awaitable[Dict[str, float]]]) -> dict:
+    # `send(i)` performs request i and returns extra timings (e.g. ttft_ms);
+    # raising counts the request as an error
+    latencies, extras, errors = [], {}, []
+    next_request = iter(range(requests))
+
+    async def client():
+        for i in next_request:
+            start = time.perf_counter()
+            try:
+                extra = await send(i)
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            for key, value in (extra or {}).items():
+                extras.setdefault(key, []).append(value)
+
+    start = time.perf_counter()
+    with RssSampler() as rss:
+        await asyncio.gather(*(client() for _ in range(clients)))
+    wall = time.perf_counter() - start
+
+    result = {
+        "requests": requests,
+        "clients": clients,
+        "errors": len(errors),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        **summarise("latency_ms", latencies)
+    }
+    for key, values in extras.items():
+        result.update(summarise(key, values))
+    if errors:
+        result["sample_errors"] = sorted(set(errors))[:5]
+    return result
+
+
+def summarise(name: str, values: List[float]) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        f"{name}_p50": round(float(p50), 2),
+        f"{name}_p95": round(float(p95), 2),
+        f"{name}_p99": round(float(p99), 2),
+        f"{name}_mean": round(float(np.mean(values)), 2),
+    }
+
+
+def start_fake_openai_server(args) -> str:
+    # OpenAI-compatible /v1/chat/completions (plain and streamed) and
+    # /v1/embeddings with the same behaviour as the in-process fakes, plus
+    # optional slow outliers and 429s, so the gateway sees real HTTP
+    import base64
+    import threading
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+    rng = random.Random(args.seed)
+
+    def rate_limited() -> bool:
+        return rng.random() < args.upstream_429_rate
+
+    def slowdown() -> float:
+        return args.upstream_slow_factor if rng.random() < args.upstream_slow_rate else 1.0
+
+    def too_many_requests():
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            headers={"retry-after-ms": "200"}
+        )
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if rate_limited():
+            return too_many_requests()
+        picker = random.Random(zlib.crc32(json.dumps(body["messages"]).encode("utf-8")))
+        words = [f"{picker.choice(TOPICS)} " for _ in range(args.llm_tokens)]
+        created = int(time.time())
+        # Headers go out with the first token, as with the real API
+        await asyncio.sleep(args.llm_latency * slowdown())
+
+        if not body.get("stream"):
+            await asyncio.sleep(len(words) / args.llm_tokens_per_second)
+            return {
+                "id": "chatcmpl-benchmark", "object": "chat.completion", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}
+            }
+
+        async def events():
+            for word in words:
+                chunk = {
+                    "id": "chatcmpl-benchmark", "object": "chat.completion.chunk", "created": created, "model": body["model"],
+                    "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1.0 / args.llm_tokens_per_second)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        if rate_limited():
+            return too_many_requests()
+        await asyncio.sleep(args.embed_latency * slowdown())
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        data = []
+        for index, text in enumerate(texts):
+            vector = hashed_vector(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": index, "embedding": vector})
+        return {"object": "list", "data": data, "model": body["model"], "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run_benchmark(args, data_dir: str) -> dict:
+    import httpx
+    import uvicorn
+    import utils
+    import notion_loader
+
+    rng = random.Random(args.seed)
+    fake_llm = make_fake_llm(args)
+    fake_embedding = make_fake_embedding(args)
+    fake_notion = FakeNotion(args.notion_pages, args.notion_latency, args.seed)
+    if args.fake_openai_server:
+        # Read by the OpenAI SDK (chat) and llama_index (embeddings)
+        os.environ["OPENAI_BASE_URL"] = os.environ["OPENAI_API_BASE"] = start_fake_openai_server(args)
+    else:
+        utils.ChatOpenAI = lambda **kwargs: fake_llm
+        utils.GatewayEmbedding = lambda **kwargs: fake_embedding
+    notion_loader.AsyncClient = fake_notion.client
+
+    import main
+    from database import engine, AsyncSessionLocal
+    from models import Chat, Message
+    from sqlalchemy import insert
+
+    # Statement echo and per-request INFO logs would swamp the measurements
+    engine.sync_engine.echo = False
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # A real server on an ephemeral port, on this event loop. httpx's
+    # ASGITransport buffers the whole response body, which would make
+    # time-to-first-token equal the total latency.
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=0, log_config=None, access_log=False))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        if serving.done():
+            serving.result()
+            raise SystemExit("Benchmark server exited during startup")
+        await asyncio.sleep(0.01)
+    base_url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}"
+    results = {}
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+
+    try:
+        limits = httpx.Limits(max_connections=args.clients + 4, max_keepalive_connections=args.clients + 4)
+        async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as http:
+            # Initialisation runs in the background after startup
+            started = time.perf_counter()
+            while (await http.get("/ready")).status_code != 200:
+                if time.perf_counter() - started > 120:
+                    raise SystemExit(f"App not ready: {(await http.get('/ready')).json()}")
+                await asyncio.sleep(0.05)
+            results["startup"] = {"ready_s": round(time.perf_counter() - started, 3)}
+
+            chat_ids = [(await http.post("/chat/new")).json()["chat_id"] for _ in range(args.clients)]
+
+            if {"message", "message_stream"} & set(scenarios):
+                corpus_path = os.path.join(data_dir, "corpus.txt")
+                with open(corpus_path, "w", encoding="utf-8") as f:
+                    f.write(corpus_text(rng, args.corpus_paragraphs))
+                # Into the shared namespace, so every chat's queries retrieve it
+                manager = main.rag_manager
+                await manager.pipeline.run(manager.document_parser.iter_nodes(corpus_path), manager.get_vector_store())
+                manager.invalidate_namespace(manager.notion_namespace)
+
+            def question(i: int) -> str:
+                words = random.Random(args.seed + i).sample(TOPICS, 3)
+                return f"What do we know about {words[0]} and {words[1]} for {words[2]}? ({i})"
+
+            for name in scenarios:
+                if name == "message":
+                    async def send(i):
+                        r = await http.post("/message", json={"chat_id": chat_ids[i % len(chat_ids)], "input": question(i)})
+                        r.raise_for_status()
+
+                elif name == "message_stream":
+                    async def send(i):
+                        start = time.perf_counter()
+                        ttft = None
+                        payload = {"chat_id": chat_ids[i % len(chat_ids)], "input": question(args.requests + i)}
+                        async with http.stream("POST", "/message/stream", json=payload) as r:
+                            r.raise_for_status()
+                            async for line in r.aiter_lines():
+                                if ttft is None and line.startswith("data:"):
+                                    ttft = (time.perf_counter() - start) * 1000
+                        if ttft is None:
+                            raise RuntimeError("Stream ended without a data event")
+                        return {"ttft_ms": ttft}
+
+                elif name == "ingest":
+                    document = corpus_text(rng, max(1, args.doc_kb * 1024 // 500)).encode("utf-8")
+
+                    async def send(i):
+                        r = await http.post(
+                            f"/ingest?chat_id={chat_ids[i % len(chat_ids)]}",
+                            files={"file": (f"doc_{i}.txt", document + f"\n\nDocument {i}.".encode())}
+                        )
+                        r.raise_for_status()
+                        job_id = r.json()["job_id"]
+                        while True:
+                            job = (await http.get(f"/ingest/{job_id}")).json()
+                            if job["status"] == "done":
+                                return {"chunks": job["chunks"]}
+                            if job["status"] == "failed":
+                                raise RuntimeError(job["error"])
+                            await asyncio.sleep(0.02)
+
+                elif name == "chats":
+                    async with AsyncSessionLocal() as session:
+                        for _ in range(args.seed_chats):
+                            chat_id = (await session.execute(insert(Chat).returning(Chat.id))).scalar_one()
+                            await session.execute(insert(Message).values([
+                                {"chat_id": chat_id, "sender": "user" if n % 2 == 0 else "assistant",
+                                 "content": corpus_text(rng, 1)} for n in range(10)
+                            ]))
+                        await session.commit()
+
+                    async def send(i):
+                        r = await http.get("/chats")
+                        r.raise_for_status()
+
+                elif name == "webhook":
+                    page_ids = list(fake_notion.pages)
+
+                    async def send(i):
+                        r = await http.post("/webhook/notion", json={
+                            "type": "page_updated",
+                            "page": {"id": page_ids[i % len(page_ids)]}
+                        })
+                        r.raise_for_status()
+
+                else:
+                    raise SystemExit(f"Unknown scenario: {name}")
+
+                print(f"▶️  {name}: {args.requests} requests, {args.clients} clients", file=sys.stderr)
+                results[name] = await drive(args.clients, args.requests, send)
+
+                if name == "message_stream" and "ttft_ms_p50" in results[name]:
+                    # If the first token arrives with the last, the stream was
+                    # buffered somewhere and TTFT measures nothing
+                    if results[name]["ttft_ms_p50"] >= results[name]["latency_ms_p50"]:
+                        raise SystemExit(
+                            f"message_stream TTFT p50 ({results[name]['ttft_ms_p50']} ms) is not below its "
+                            f"latency p50 ({results[name]['latency_ms_p50']} ms); responses are being buffered"
+                        )
+
+                if name == "webhook":
+                    # Webhooks only queue work; also time until the re-indexing settles
+                    started = time.perf_counter()
+                    while not main.notion_sync.idle:
+                        await asyncio.sleep(0.05)
+                    results[name]["drain_s"] = round(time.perf_counter() - started, 3)
+                    results[name]["notion_sync"] = main.notion_sync.stats()
+        if main.rag_manager.lexical_index is not None:
+            results["lexical_index"] = main.rag_manager.lexical_index.stats()
+        if args.fake_openai_server:
+            results["llm_gateways"] = {
+                "llm": main.rag_manager.llm_gateway.stats(),
+                "embedding": main.rag_manager.embedding_gateway.stats()
+            }
+    finally:
+        server.should_exit = True
+        await serving
+
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_comparison(current: dict, baseline: dict):
+    keys = ["latency_ms_p50", "latency_ms_p95", "latency_ms_p99", "throughput_rps", "peak_rss_mb"]
+    print(f"\nvs {baseline.get('commit', '?')}:", file=sys.stderr)
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in keys:
+            if key in result and before.get(key):
+                change = (result[key] - before[key]) / before[key] * 100
+                deltas.append(f"{key} {before[key]} -> {result[key]} ({change:+.1f}%)")
+        print(f"  {name}: " + ", ".join(deltas), file=sys.stderr)
+
+
+def main():
+    args = parse_args()
+    data_dir = tempfile.mkdtemp(prefix="rag-bench-")
+    configure_environment(args, data_dir)
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        # Keep stdout clean for the JSON report; some libraries print notices
+        with contextlib.redirect_stdout(sys.stderr):
+            scenarios = asyncio.run(run_benchmark(args, data_dir))
+    finally:
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "keep_data")},
+        "scenarios": scenarios
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+        print(f"✅ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# chunking.py
+
+import os
+import re
+import time
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+import tiktoken
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.node_parser.interface import NodeParser
+from llama_index.schema import BaseNode, MetadataMode, NodeRelationship, TextNode
+
+import metrics
+
+# Sentence-ish units: text up to and including sentence punctuation or a run
+# of newlines, plus the whitespace after it. Concatenated they give back the
+# original text exactly.
+_UNIT = re.compile(r"[^.!?\n]*(?:[.!?]+|\n+|$)\s*")
+
+
+class TokenChunker(NodeParser):
+    # The one chunker for every ingestion path: uploads (in the parse worker
+    # processes), Notion database syncs and single-page updates. Splits text
+    # into sentence units, tokenises all units of all documents in a batch with
+    # encode_ordinary_batch (not a call per unit), then packs units greedily
+    # into chunks of chunk_size tokens (less the document's metadata header),
+    # carrying up to chunk_overlap tokens of trailing units into the next
+    # chunk. Units longer than a chunk are cut on token boundaries.
+    chunk_size: int = 256
+    chunk_overlap: int = 50
+
+    _encoding = PrivateAttr()
+    _lock = PrivateAttr()
+    _stats: Dict[str, float] = PrivateAttr()
+
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, model: str = "gpt-4", **kwargs):
+        super().__init__(
+            chunk_size=chunk_size or int(os.getenv("CHUNK_SIZE", "256")),
+            chunk_overlap=chunk_overlap if chunk_overlap is not None else int(os.getenv("CHUNK_OVERLAP", "50")),
+            **kwargs
+        )
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError(f"chunk_overlap ({self.chunk_overlap}) must be smaller than chunk_size ({self.chunk_size})")
+        self._encoding = tiktoken.encoding_for_model(model)
+        self._lock = threading.Lock()
+        self._stats = {"documents": 0, "chunks": 0, "tokens": 0, "seconds": 0.0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenChunker"
+
+    def _budget(self, document: BaseNode, metadata_tokens: int) -> int:
+        budget = self.chunk_size - metadata_tokens
+        if budget <= self.chunk_overlap:
+            raise ValueError(
+                f"Metadata of {document.node_id} takes {metadata_tokens} of {self.chunk_size} chunk tokens"
+            )
+        return budget
+
+    def _split_long(self, text: str, tokens: List[int], budget: int) -> List[Tuple[str, int]]:
+        return [
+            (self._encoding.decode(tokens[start:start + budget]), len(tokens[start:start + budget]))
+            for start in range(0, len(tokens), budget)
+        ]
+
+    def _pack(self, units: List[Tuple[int, str, int]], budget: int) -> List[Tuple[int, str, int]]:
+        # units are (char offset, text, tokens); returns chunks in the same shape
+        chunks, current, current_tokens = [], [], 0
+
+        def emit():
+            raw = "".join(text for _, text, _ in current)
+            text = raw.strip()
+            if text:
+                chunks.append((current[0][0] + len(raw) - len(raw.lstrip()), text, current_tokens))
+
+        for unit in units:
+            if current and current_tokens + unit[2] > budget:
+                emit()
+                # Carry trailing units (up to chunk_overlap tokens) forward
+                carried, carried_tokens = [], 0
+                for previous in reversed(current):
+                    if carried_tokens + previous[2] > self.chunk_overlap:
+                        break
+                    carried.insert(0, previous)
+                    carried_tokens += previous[2]
+                while carried and carried_tokens + unit[2] > budget:
+                    carried_tokens -= carried.pop(0)[2]
+                current, current_tokens = carried, carried_tokens
+            current.append(unit)
+            current_tokens += unit[2]
+        if current:
+            emit()
+        return chunks
+
+    def chunk(self, nodes: Sequence[BaseNode]) -> Tuple[List[TextNode], int]:
+        # Chunks and their total token count, without linking or recording stats
+        texts = [node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes]
+        units = [
+            [(match.start(), match.group()) for match in _UNIT.finditer(text) if match.group()]
+            for text in texts
+        ]
+
+        # All tokenisation for the batch happens in two encode_ordinary_batch calls
+        headers = []
+        for node in nodes:
+            if self.include_metadata:
+                headers.append(node.get_metadata_str(mode=MetadataMode.EMBED))
+                headers.append(node.get_metadata_str(mode=MetadataMode.LLM))
+            else:
+                headers.extend(["", ""])
+        header_tokens = [len(tokens) for tokens in self._encoding.encode_ordinary_batch(headers)]
+        flat_tokens = iter(self._encoding.encode_ordinary_batch([text for doc in units for _, text in doc]))
+
+        chunked: List[TextNode] = []
+        total_tokens = 0
+        for index, (node, doc_units) in enumerate(zip(nodes, units)):
+            budget = self._budget(node, max(header_tokens[2 * index], header_tokens[2 * index + 1]))
+            sized = []
+            for offset, text in doc_units:
+                tokens = next(flat_tokens)
+                if len(tokens) <= budget:
+                    sized.append((offset, text, len(tokens)))
+                    continue
+                for piece, count in self._split_long(text, tokens, budget):
+                    sized.append((offset, piece, count))
+                    offset += len(piece)
+
+            for start, text, tokens in self._pack(sized, budget):
+                chunk = TextNode(
+                    id_=self.id_func(len(chunked), node),
+                    text=text,
+                    start_char_idx=start,
+                    end_char_idx=start + len(text),
+                    metadata=dict(node.metadata) if self.include_metadata else {},
+                    excluded_embed_metadata_keys=list(node.excluded_embed_metadata_keys),
+                    excluded_llm_metadata_keys=list(node.excluded_llm_metadata_keys),
+                    metadata_seperator=node.metadata_seperator,
+                    metadata_template=node.metadata_template,
+                    text_template=node.text_template
+                )
+                chunk.relationships[NodeRelationship.SOURCE] = node.as_related_node_info()
+                chunked.append(chunk)
+                total_tokens += tokens
+        return chunked, total_tokens
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        started = time.perf_counter()
+        chunked, tokens = self.chunk(nodes)
+        self.record(len(nodes), len(chunked), tokens, time.perf_counter() - started)
+        return chunked
+
+    def get_nodes_from_documents(self, documents: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        # Char offsets and metadata are set while chunking, so skip the base
+        # class's per-node text search
+        nodes = self._parse_nodes(documents, show_progress=show_progress, **kwargs)
+        if self.include_prev_next_rel:
+            for previous, node in zip(nodes, nodes[1:]):
+                previous.relationships[NodeRelationship.NEXT] = node.as_related_node_info()
+                node.relationships[NodeRelationship.PREVIOUS] = previous.as_related_node_info()
+        return nodes
+
+    def record(self, documents: int, chunks: int, tokens: int, seconds: float):
+        # Also called for chunking done in the parse worker processes
+        with self._lock:
+            self._stats["documents"] += documents
+            self._stats["chunks"] += chunks
+            self._stats["tokens"] += tokens
+            self._stats["seconds"] += seconds
+        metrics.observe("chunk", seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["avg_chunk_tokens"] = round(stats["tokens"] / stats["chunks"], 1) if stats["chunks"] else 0.0
+        stats["chunk_size"] = self.chunk_size
+        stats["chunk_overlap"] = self.chunk_overlap
+        return stats
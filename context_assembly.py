@@ -0,0 +1,161 @@
+# context_assembly.py
+
+import os
+import logging
+import threading
+from typing import Dict, List, Optional
+
+import tiktoken
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.postprocessor.types import BaseNodePostprocessor
+from llama_index.schema import MetadataMode, NodeRelationship, NodeWithScore, QueryBundle, TextNode
+
+import metrics
+
+
+def _merge_text(first: str, second: str, max_overlap: int = 2000) -> str:
+    # Neighbouring chunks repeat the tail of the previous chunk (chunk_overlap),
+    # so join them on the longest suffix/prefix match instead of duplicating it
+    for size in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+class ContextAssembler(BaseNodePostprocessor):
+    # Runs between retrieval and synthesis: drops chunks scoring below
+    # score_cutoff, stitches retrieved chunks that are prev/next neighbours
+    # into one passage, then keeps the best passages that fit in token_budget
+    # (truncating the last one if enough room is left). Per-request token
+    # counts are accumulated for stats().
+    score_cutoff: float = 0.0
+    token_budget: int = 1500
+    min_truncated_tokens: int = 64
+
+    _encoding = PrivateAttr()
+    _lock = PrivateAttr()
+    _stats: Dict[str, int] = PrivateAttr()
+
+    def __init__(self, score_cutoff: float = None, token_budget: int = None, model: str = "gpt-4", **kwargs):
+        super().__init__(
+            score_cutoff=score_cutoff if score_cutoff is not None else float(os.getenv("CONTEXT_SCORE_CUTOFF", "0.7")),
+            token_budget=token_budget or int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")),
+            **kwargs
+        )
+        self._encoding = tiktoken.encoding_for_model(model)
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "context_tokens": 0,
+            "last_prompt_tokens": 0,
+            "chunks_retrieved": 0,
+            "chunks_below_cutoff": 0,
+            "chunks_merged": 0,
+            "chunks_over_budget": 0,
+        }
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextAssembler"
+
+    def _merge_neighbours(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        by_id = {node.node.node_id: node for node in nodes}
+        # Start a passage at every node whose predecessor wasn't retrieved
+        heads = [node for node in nodes if self._related_id(node, NodeRelationship.PREVIOUS) not in by_id]
+
+        passages = []
+        for head in heads:
+            run = [head]
+            while (next_id := self._related_id(run[-1], NodeRelationship.NEXT)) in by_id and len(run) < len(nodes):
+                run.append(by_id[next_id])
+            if len(run) == 1:
+                passages.append(head)
+                continue
+
+            text = run[0].node.get_content()
+            for node in run[1:]:
+                text = _merge_text(text, node.node.get_content())
+            merged = TextNode(
+                id_=run[0].node.node_id,
+                text=text,
+                metadata=run[0].node.metadata,
+                excluded_embed_metadata_keys=run[0].node.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=run[0].node.excluded_llm_metadata_keys
+            )
+            for relationship in (NodeRelationship.SOURCE, NodeRelationship.PREVIOUS):
+                if relationship in run[0].node.relationships:
+                    merged.relationships[relationship] = run[0].node.relationships[relationship]
+            if NodeRelationship.NEXT in run[-1].node.relationships:
+                merged.relationships[NodeRelationship.NEXT] = run[-1].node.relationships[NodeRelationship.NEXT]
+            passages.append(NodeWithScore(node=merged, score=max(node.score or 0.0 for node in run)))
+            self._count("chunks_merged", len(run) - 1)
+
+        passages.sort(key=lambda node: node.score or 0.0, reverse=True)
+        return passages
+
+    @staticmethod
+    def _related_id(node: NodeWithScore, relationship: NodeRelationship) -> Optional[str]:
+        related = node.node.relationships.get(relationship)
+        return related.node_id if related is not None else None
+
+    def _count(self, key: str, amount: int):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        kept = [node for node in nodes if node.score is None or node.score >= self.score_cutoff]
+        self._count("chunks_retrieved", len(nodes))
+        self._count("chunks_below_cutoff", len(nodes) - len(kept))
+
+        passages = self._merge_neighbours(kept)
+
+        # Count what the LLM will actually see, metadata header included
+        texts = [passage.node.get_content(metadata_mode=MetadataMode.LLM) for passage in passages]
+        token_counts = [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts)]
+
+        selected, used = [], 0
+        for passage, text, tokens in zip(passages, texts, token_counts):
+            remaining = self.token_budget - used
+            if tokens <= remaining:
+                selected.append(passage)
+                used += tokens
+                continue
+            if remaining >= self.min_truncated_tokens:
+                # Trim the passage body so passage plus header fits the budget
+                body_tokens = self._encoding.encode_ordinary(passage.node.get_content())
+                keep = max(0, len(body_tokens) - (tokens - remaining))
+                if keep:
+                    passage.node.set_content(self._encoding.decode(body_tokens[:keep]))
+                    selected.append(passage)
+                    used += remaining
+            self._count("chunks_over_budget", len(passages) - len(selected))
+            break
+
+        query_tokens = len(self._encoding.encode_ordinary(query_bundle.query_str)) if query_bundle else 0
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["context_tokens"] += used
+            self._stats["prompt_tokens"] += used + query_tokens
+            self._stats["last_prompt_tokens"] = used + query_tokens
+        metrics.LLM_TOKENS.labels("prompt").inc(used + query_tokens)
+
+        logging.getLogger(__name__).debug(
+            f"Context: {len(selected)}/{len(nodes)} chunks, {used} context tokens, {query_tokens} query tokens"
+        )
+        return selected
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._encoding.encode_ordinary(text))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_prompt_tokens"] = round(stats["prompt_tokens"] / stats["requests"], 1) if stats["requests"] else 0.0
+        stats["score_cutoff"] = self.score_cutoff
+        stats["token_budget"] = self.token_budget
+        return stats
@@ -1,7 +1,7 @@
 # database.py
 
 import os
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Text, String, DateTime, ForeignKey, func
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Integer, Text, String, DateTime, ForeignKey, func
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, relationship
 from sqlalchemy.ext.declarative import declarative_base
@@ -9,21 +9,36 @@ from dotenv import load_dotenv
 from models import Base  # Import Base from models.py
 
 metadata = MetaData()
-Base = declarative_base()
 
 def get_db_url():
     load_dotenv()
     url = os.getenv("SUPABASE_DB")
     return url
 
+def get_engine_options(url: str) -> dict:
+    # SQLite (used for local runs and the benchmark) has no connection pool
+    # to size; Postgres keeps the original pool settings
+    if url.startswith("sqlite"):
+        return {}
+    return {"pool_size": 5, "max_overflow": 10}
+
 # Create async engine
 engine = create_async_engine(
     get_db_url(),
-    echo=True,
-    pool_size=5,
-    max_overflow=10
+    # SQL echo logs every statement and its parameters; opt in with DB_ECHO=1
+    echo=os.getenv("DB_ECHO", "0") == "1",
+    **get_engine_options(get_db_url())
 )
 
+# SQLite leaves foreign keys unenforced unless each connection turns them
+# on; message inserts rely on the chat_id constraint to reject unknown chats
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # Create async session
 AsyncSessionLocal = sessionmaker(
     engine,
@@ -47,3 +62,11 @@ async def init_db(drop_existing=False):
         if drop_existing:
             await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips indexes on tables that already exist, so add any
+        # index declared on a model after its table was first created
+        await conn.run_sync(_create_missing_indexes)
+
+def _create_missing_indexes(conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
@@ -0,0 +1,321 @@
+# document_parser.py
+
+import os
+import time
+import hashlib
+import logging
+import itertools
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from llama_index.schema import NodeRelationship, RelatedNodeInfo, TextNode
+
+# Chunks as (text, metadata, excluded embed keys, excluded LLM keys), plus
+# (documents, tokens, chunking seconds); all that crosses back from a worker
+ChunkPayload = Tuple[List[Tuple[str, dict, List[str], List[str]]], Tuple[int, int, float]]
+
+# Set once per worker process by _init_worker
+_chunker = None
+_docx_reader = None
+_started = None
+
+# How often a waiting iter_nodes checks its task against the timeout
+_POLL_SECONDS = 0.5
+
+
+def _init_worker(chunk_size: int, chunk_overlap: int, started):
+    global _chunker, _started
+    from chunking import TokenChunker
+
+    _started = started
+
+    _chunker = TokenChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    try:
+        _get_docx_reader()
+    except Exception as e:
+        # Retried on the first .docx; other file types don't need it
+        logging.getLogger(__name__).warning(f"DocxReader unavailable in parse worker: {str(e)}")
+
+
+def _get_docx_reader():
+    global _docx_reader
+    if _docx_reader is None:
+        from llama_index.readers import download_loader
+
+        _docx_reader = download_loader("DocxReader")()
+    return _docx_reader
+
+
+def _chunk(documents, file_name: str) -> ChunkPayload:
+    documents = [document for document in documents if document.text.strip()]
+    for document in documents:
+        # The upload's own name, not the spool file's: it's part of the
+        # embedded text, so it has to be the same every time the file is sent
+        document.metadata["file_name"] = file_name
+        for excluded in (document.excluded_embed_metadata_keys, document.excluded_llm_metadata_keys):
+            if "file_name" in excluded:
+                excluded.remove("file_name")
+            if "file_path" in document.metadata and "file_path" not in excluded:
+                excluded.append("file_path")
+    started = time.perf_counter()
+    nodes, tokens = _chunker.chunk(documents) if documents else ([], 0)
+    seconds = time.perf_counter() - started
+    return [
+        (node.text, node.metadata, node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys)
+        for node in nodes
+    ], (len(documents), tokens, seconds)
+
+
+def _parse_pdf_pages(file_path: str, file_name: str, start: int, end: int) -> ChunkPayload:
+    # One document per page, same metadata as llama-hub's PDFReader
+    from llama_index.schema import Document
+    from pypdf import PdfReader
+
+    reader = PdfReader(file_path)
+    page_labels = reader.page_labels
+    return _chunk((
+        Document(
+            text=reader.pages[page_number].extract_text() or "",
+            metadata={"page_label": page_labels[page_number]}
+        )
+        for page_number in range(start, end)
+    ), file_name)
+
+
+def _parse_text(text: str, file_name: str) -> ChunkPayload:
+    from llama_index.schema import Document
+
+    return _chunk([Document(text=text)], file_name)
+
+
+def _parse_file(file_path: str, file_name: str) -> ChunkPayload:
+    if file_path.lower().endswith('.docx'):
+        return _chunk(_get_docx_reader().load_data(file=file_path), file_name)
+
+    from llama_index import SimpleDirectoryReader
+
+    return _chunk(SimpleDirectoryReader(input_files=[file_path]).load_data(), file_name)
+
+
+def _run_task(token: int, fn, *args) -> ChunkPayload:
+    # Tells the parent the task is running, so its timeout counts from now
+    # rather than from when it was queued behind other files' tasks
+    _started.put(token)
+    return fn(*args)
+
+
+def _warm():
+    return os.getpid()
+
+
+class DocumentParser:
+    # Extracts uploaded files and chunks them with the shared TokenChunker's
+    # settings in a pool of worker processes, so CPU-bound PDF/DOCX parsing and
+    # tokenisation don't hold the web process's GIL. Workers send back only
+    # chunk text and metadata; nodes are built and linked here and chunking
+    # stats recorded on the chunker. Large PDFs are split into page ranges
+    # parsed in parallel, text files into blocks. A task (page range, text
+    # block or whole file) running longer than timeout seconds fails its file
+    # and restarts the pool to reclaim the worker; other files' tasks lost to
+    # the restart are resubmitted, up to max_restarts times per file.
+    def __init__(
+        self,
+        chunker,
+        workers: int = None,
+        timeout: float = None,
+        pdf_pages_per_task: int = None,
+        text_block_chars: int = None,
+        max_restarts: int = None
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.chunker = chunker
+        self.workers = workers or int(os.getenv("PARSE_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) - 1)))))
+        self.timeout = timeout or float(os.getenv("PARSE_TIMEOUT_SECONDS", "300"))
+        self.pdf_pages_per_task = pdf_pages_per_task or int(os.getenv("PARSE_PDF_PAGES_PER_TASK", "20"))
+        self.text_block_chars = text_block_chars or int(os.getenv("TEXT_BLOCK_CHARS", "65536"))
+        self.max_restarts = max_restarts if max_restarts is not None else int(os.getenv("PARSE_MAX_RESTARTS", "3"))
+        self._context = multiprocessing.get_context(os.getenv("PARSE_START_METHOD", "spawn"))
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Workers put a task's token here as it starts running; a new queue
+        # per pool, as a terminated worker may leave the old one locked
+        self._started = None
+        self._started_at: Dict[int, float] = {}
+        self._tokens = itertools.count()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._started = self._context.SimpleQueue()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(self.chunker.chunk_size, self.chunker.chunk_overlap, self._started)
+                )
+            return self._pool
+
+    def _submit(self, task: tuple) -> Tuple[int, ProcessPoolExecutor, Future]:
+        token = next(self._tokens)
+        while True:
+            pool = self._get_pool()
+            try:
+                return token, pool, pool.submit(_run_task, token, *task)
+            except (BrokenProcessPool, RuntimeError):
+                # Broken, or shut down by a restart since _get_pool
+                self._restart(pool)
+
+    def _running_since(self, token: int) -> Optional[float]:
+        with self._lock:
+            while self._started is not None and not self._started.empty():
+                self._started_at[self._started.get()] = time.monotonic()
+            return self._started_at.get(token)
+
+    def _result(self, token: int, pool: ProcessPoolExecutor, future: Future, file_name: str) -> ChunkPayload:
+        try:
+            while True:
+                try:
+                    return future.result(timeout=_POLL_SECONDS)
+                except FuturesTimeout:
+                    started = self._running_since(token)
+                    if started is not None and time.monotonic() - started > self.timeout:
+                        self._restart(pool)
+                        raise TimeoutError(f"Parsing {file_name} timed out after {self.timeout:g}s")
+        finally:
+            with self._lock:
+                self._started_at.pop(token, None)
+
+    def start(self):
+        # Start every worker now (imports, node parser, DocxReader) rather
+        # than on the first upload. The loader is downloaded here once so the
+        # workers all load it from llama_index's cache.
+        try:
+            from llama_index.readers import download_loader
+
+            download_loader("DocxReader")
+        except Exception as e:
+            self.logger.warning(f"Couldn't resolve DocxReader: {str(e)}")
+        pool = self._get_pool()
+        for future in [pool.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+        self.logger.info(f"✅ Started {self.workers} document parse workers")
+
+    def _restart(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        # A timed-out task can't be cancelled once running, so end its process
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _iter_text_blocks(self, file_path: str) -> Iterator[str]:
+        # Paragraph-aligned blocks of about text_block_chars, read lazily
+        block, size = [], 0
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                block.append(line)
+                size += len(line)
+                if size >= self.text_block_chars and not line.strip():
+                    yield "".join(block)
+                    block, size = [], 0
+        if block:
+            yield "".join(block)
+
+    def _iter_tasks(self, file_path: str, file_name: str) -> Iterator[tuple]:
+        lower = file_path.lower()
+        if lower.endswith('.pdf'):
+            from pypdf import PdfReader
+
+            # Only reads the page tree; text extraction happens in the workers
+            pages = len(PdfReader(file_path).pages)
+            for start in range(0, pages, self.pdf_pages_per_task):
+                yield _parse_pdf_pages, file_path, file_name, start, min(pages, start + self.pdf_pages_per_task)
+        elif lower.endswith('.txt'):
+            for block in self._iter_text_blocks(file_path):
+                yield _parse_text, block, file_name
+        else:
+            yield _parse_file, file_path, file_name
+
+    @staticmethod
+    def _file_digest(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            while block := f.read(1 << 20):
+                digest.update(block)
+        return digest.hexdigest()[:16]
+
+    def iter_nodes(self, file_path: str, file_name: str = None, source_id: str = None) -> Iterator[TextNode]:
+        # Blocking generator, meant to be driven from an ingest executor
+        # thread. Keeps up to 2 * workers tasks in flight and yields chunks in
+        # document order, with prev/next links across task boundaries.
+        # file_name is the name the chunks are labelled with (the upload's,
+        # when file_path is a spool file); it defaults to file_path's own.
+        # Chunk IDs are source_id plus the chunk's ordinal, so parsing the
+        # same source again (a re-queued job) overwrites its vectors instead
+        # of adding duplicates; source_id defaults to a hash of the file.
+        file_name = os.path.basename(file_name or file_path)
+        source_id = source_id or f"file_{self._file_digest(file_path)}"
+        source = RelatedNodeInfo(node_id=source_id)
+        ordinal = itertools.count()
+        tasks = self._iter_tasks(file_path, file_name)
+        inflight = deque()  # (task, token, pool, future)
+        previous = None
+        restarts = 0
+
+        def fill():
+            for task in tasks:
+                inflight.append((task, *self._submit(task)))
+                if len(inflight) >= 2 * self.workers:
+                    return
+
+        try:
+            fill()
+            while inflight:
+                task, token, pool, future = inflight[0]
+                try:
+                    payloads, (documents, tokens, seconds) = self._result(token, pool, future, file_name)
+                except (BrokenProcessPool, CancelledError):
+                    # The pool was restarted under these tasks (another file
+                    # timed out, or a worker died); they're pure, so run them again
+                    restarts += 1
+                    if restarts > self.max_restarts:
+                        raise
+                    self.logger.warning(f"Parse pool restarted, resubmitting {len(inflight)} tasks for {file_name}")
+                    self._restart(pool)
+                    for index, (task, *_) in enumerate(list(inflight)):
+                        inflight[index] = (task, *self._submit(task))
+                    continue
+                inflight.popleft()
+                fill()
+                self.chunker.record(documents, len(payloads), tokens, seconds)
+                for text, metadata, excluded_embed, excluded_llm in payloads:
+                    node = TextNode(
+                        id_=f"{source_id}:{next(ordinal)}",
+                        text=text,
+                        metadata=metadata,
+                        excluded_embed_metadata_keys=excluded_embed,
+                        excluded_llm_metadata_keys=excluded_llm
+                    )
+                    node.relationships[NodeRelationship.SOURCE] = source
+                    if previous is not None:
+                        previous.relationships[NodeRelationship.NEXT] = node.as_related_node_info()
+                        node.relationships[NodeRelationship.PREVIOUS] = previous.as_related_node_info()
+                        yield previous
+                    previous = node
+            if previous is not None:
+                yield previous
+        finally:
+            for _, _, _, future in inflight:
+                future.cancel()
@@ -0,0 +1,95 @@
+# executors.py
+
+import os
+import asyncio
+import functools
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ExecutorBusy(Exception):
+    def __init__(self, name: str):
+        super().__init__(f"{name} capacity exhausted, try again later")
+        self.name = name
+
+
+class BoundedExecutor:
+    # Thread pool for blocking LlamaIndex/Pinecone/OpenAI work. At most
+    # max_workers calls run at once and max_queue more may wait; anything
+    # beyond that is rejected with ExecutorBusy instead of piling up.
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self.rejected = 0
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def has_capacity(self) -> bool:
+        return self._inflight < self.capacity
+
+    def check_capacity(self):
+        if not self.has_capacity():
+            raise ExecutorBusy(self.name)
+
+    def _release(self, _future):
+        with self._lock:
+            self._inflight -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._inflight >= self.capacity:
+                self.rejected += 1
+                self.logger.warning(f"⛔ {self.name} executor full ({self._inflight}/{self.capacity})")
+                raise ExecutorBusy(self.name)
+            self._inflight += 1
+
+        # Release the slot when the thread actually finishes, not when the
+        # awaiting request is cancelled, so abandoned work still counts.
+        # The caller's context (e.g. its metrics trace) follows the call.
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, functools.partial(fn, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self._inflight,
+            "max_workers": self.max_workers,
+            "capacity": self.capacity,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+query_executor = BoundedExecutor(
+    "query",
+    max_workers=int(os.getenv("QUERY_MAX_WORKERS", "8")),
+    max_queue=int(os.getenv("QUERY_MAX_QUEUE", "32"))
+)
+
+ingest_executor = BoundedExecutor(
+    "ingest",
+    max_workers=int(os.getenv("INGEST_MAX_WORKERS", "6")),
+    max_queue=int(os.getenv("INGEST_MAX_QUEUE", "16"))
+)
+
+# Per-namespace searches fanned out from a query running on query_executor
+retrieval_executor = BoundedExecutor(
+    "retrieval",
+    max_workers=int(os.getenv("RETRIEVAL_MAX_WORKERS", "16")),
+    max_queue=int(os.getenv("RETRIEVAL_MAX_QUEUE", "32"))
+)
@@ -10,6 +10,12 @@ interface Message {
   sender: 'user' | 'assistant';
 }
 
+interface ApiMessage {
+  message_id: number;
+  content: string;
+  sender: 'user' | 'assistant';
+}
+
 interface ChatProps {
   chatId: number;
 }
@@ -17,6 +23,8 @@ interface ChatProps {
 interface ChatState {
   messages: Message[];
   isLoading: boolean;
+  hasMore: boolean;
+  isLoadingEarlier: boolean;
   isUploading: boolean;
   isIngesting: boolean;
   selectedFile: File | null;
@@ -29,6 +37,8 @@ export default function Chat({ chatId }: ChatProps) {
   const [state, setState] = useState<ChatState>({
     messages: [],
     isLoading: true,
+    hasMore: false,
+    isLoadingEarlier: false,
     isUploading: false,
     isIngesting: false,
     selectedFile: null,
@@ -37,15 +47,21 @@ export default function Chat({ chatId }: ChatProps) {
     canQuery: true
   });
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const messagesRef = useRef<HTMLDivElement>(null);
+
+  const toMessages = (messages: ApiMessage[]): Message[] =>
+    messages.map(({ message_id, content, sender }) => ({ id: message_id, content, sender }));
 
   useEffect(() => {
     const fetchMessages = async () => {
       try {
         setState(prev => ({ ...prev, isLoading: true }));
+        // The API returns the newest page; older pages are loaded on demand
         const data = await chatQueries.getChat(chatId);
         setState(prev => ({ 
           ...prev, 
-          messages: data.messages,
+          messages: toMessages(data.messages),
+          hasMore: data.has_more,
           isLoading: false 
         }));
       } catch (error) {
@@ -57,6 +73,33 @@ export default function Chat({ chatId }: ChatProps) {
     fetchMessages();
   }, [chatId]);
 
+  const loadEarlier = async () => {
+    const oldest = state.messages[0];
+    if (!oldest || state.isLoadingEarlier) return;
+
+    try {
+      setState(prev => ({ ...prev, isLoadingEarlier: true }));
+      const data = await chatQueries.getChat(chatId, oldest.id);
+      // Keep the view where it was once the older page is prepended
+      const container = messagesRef.current;
+      const previousHeight = container?.scrollHeight ?? 0;
+      setState(prev => ({
+        ...prev,
+        messages: [...toMessages(data.messages), ...prev.messages],
+        hasMore: data.has_more,
+        isLoadingEarlier: false
+      }));
+      requestAnimationFrame(() => {
+        if (container) {
+          container.scrollTop += container.scrollHeight - previousHeight;
+        }
+      });
+    } catch (error) {
+      console.error('Error fetching earlier messages:', error);
+      setState(prev => ({ ...prev, isLoadingEarlier: false }));
+    }
+  };
+
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
     if (!file) return;
@@ -94,7 +137,10 @@ export default function Chat({ chatId }: ChatProps) {
           throw new Error(response.error);
         }
 
-        await new Promise(resolve => setTimeout(resolve, 2000));
+        const job = await chatQueries.waitForIngestJob(response.job_id);
+        if (job.status === 'failed') {
+          throw new Error(job.error);
+        }
 
         setState(prev => ({
           ...prev,
@@ -173,7 +219,25 @@ export default function Chat({ chatId }: ChatProps) {
         </div>
       ) : (
         <>
-          <div className="flex-1 overflow-y-auto p-4 space-y-4">
+          <div ref={messagesRef} className="flex-1 overflow-y-auto p-4 space-y-4">
+            {state.hasMore && (
+              <div className="flex justify-center">
+                <button
+                  type="button"
+                  onClick={loadEarlier}
+                  disabled={state.isLoadingEarlier}
+                  className="px-4 py-2 rounded-lg bg-gray-700 hover:bg-gray-600 text-white text-sm 
+                    disabled:opacity-50 disabled:cursor-not-allowed"
+                >
+                  {state.isLoadingEarlier ? (
+                    <Loader2 className="w-4 h-4 animate-spin" />
+                  ) : (
+                    'Load earlier messages'
+                  )}
+                </button>
+              </div>
+            )}
+            
             {state.messages.map((message) => (
               <div key={message.id} className={`flex ${
                 message.sender === 'user' ? 'justify-end' : 'justify-start'
@@ -6,10 +6,11 @@ import { chatQueries } from '@/lib/queries';
 
 interface Chat {
   id: number;
-  messages: Array<{
+  created_at: string | null;
+  preview: {
     content: string;
     sender: string;
-  }>;
+  } | null;
 }
 
 interface SidebarProps {
@@ -21,11 +22,13 @@ interface SidebarProps {
 export default function Sidebar({ currentChatId, onChatSelect, onNewChat }: SidebarProps) {
   const [chats, setChats] = useState<Chat[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<number | null>(null);
 
   const fetchChats = useCallback(async () => {
     try {
       const data = await chatQueries.getAllChats();
-      setChats(data);
+      setChats(data.chats);
+      setNextCursor(data.next_cursor);
     } catch (error) {
       console.error('Error fetching chats:', error);
     } finally {
@@ -37,8 +40,19 @@ export default function Sidebar({ currentChatId, onChatSelect, onNewChat }: Side
     fetchChats();
   }, [fetchChats, currentChatId]);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      const data = await chatQueries.getAllChats(nextCursor);
+      setChats(prev => [...prev, ...data.chats]);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      console.error('Error fetching chats:', error);
+    }
+  };
+
   const getChatPreview = (chat: Chat) => {
-    const firstMessage = chat.messages[0]?.content;
+    const firstMessage = chat.preview?.content;
     return firstMessage ? 
       (firstMessage.length > 30 ? firstMessage.substring(0, 30) + '...' : firstMessage) 
       : 'New Chat';
@@ -72,6 +86,14 @@ export default function Sidebar({ currentChatId, onChatSelect, onNewChat }: Side
             </button>
           ))
         )}
+        {!loading && nextCursor && (
+          <button
+            onClick={loadMore}
+            className="p-4 w-full text-center text-gray-400 hover:bg-gray-800"
+          >
+            Load more
+          </button>
+        )}
       </div>
     </div>
   );
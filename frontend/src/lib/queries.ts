@@ -12,13 +12,17 @@ export const chatQueries = {
     return response.json();
   },
 
-  getChat: async (chatId: number) => {
-    const response = await fetch(`${API_URL}/chat/${chatId}`);
+  getChat: async (chatId: number, before?: number) => {
+    // The API sends ETag + no-cache, so the browser revalidates with
+    // If-None-Match and reuses its cached copy on a 304
+    const params = before ? `?before=${before}` : '';
+    const response = await fetch(`${API_URL}/chat/${chatId}${params}`);
     return response.json();
   },
 
-  getAllChats: async () => {
-    const response = await fetch(`${API_URL}/chats`);
+  getAllChats: async (cursor?: number) => {
+    const params = cursor ? `?cursor=${cursor}` : '';
+    const response = await fetch(`${API_URL}/chats${params}`);
     return response.json();
   },
 
@@ -46,4 +50,19 @@ export const chatQueries = {
     });
     return response.json();
   },
+
+  getIngestJob: async (jobId: number) => {
+    const response = await fetch(`${API_URL}/ingest/${jobId}`);
+    return response.json();
+  },
+
+  waitForIngestJob: async (jobId: number, intervalMs = 1000) => {
+    while (true) {
+      const job = await chatQueries.getIngestJob(jobId);
+      if (job.status === 'done' || job.status === 'failed') {
+        return job;
+      }
+      await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+  },
 };
@@ -0,0 +1,96 @@
+# hybrid_retriever.py
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core.base_retriever import BaseRetriever
+from llama_index.schema import NodeWithScore, QueryBundle
+
+import metrics
+
+
+class HybridRetriever(BaseRetriever):
+    # Puts the local BM25 search next to the vector search and merges the two
+    # ranked lists with reciprocal-rank fusion: a chunk scores
+    # 1 / (rrf_k + rank) for each list it appears in, and the best
+    # similarity_top_k by that sum go on. A chunk keeps the higher of its
+    # vector similarity and lexical score (about the idf-weighted share of
+    # the query's terms it contains) as its score, so ContextAssembler's
+    # cutoff still drops chunks that only weakly match either way.
+    # With fast_path_score set, a query whose best lexical hit reaches that
+    # score and beats the runner-up by fast_path_ratio is answered from the
+    # lexical hits alone, without the vector search. Callers can ask
+    # fast_path() first and skip embedding the query when it says yes.
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        lexical_index,
+        namespaces: Tuple[str, ...],
+        similarity_top_k: int,
+        candidates: int,
+        rrf_k: float = 60.0,
+        fast_path_score: Optional[float] = None,
+        fast_path_ratio: float = 2.0
+    ):
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self._vector_retriever = vector_retriever
+        self._lexical_index = lexical_index
+        self._namespaces = namespaces
+        self._similarity_top_k = similarity_top_k
+        self._candidates = candidates
+        self._rrf_k = rrf_k
+        self._fast_path_score = fast_path_score
+        self._fast_path_ratio = fast_path_ratio
+        self._searched: Dict[str, List[NodeWithScore]] = {}  # built per query, so this stays tiny
+
+    def _lexical(self, query_str: str) -> List[NodeWithScore]:
+        if query_str in self._searched:
+            return self._searched[query_str]
+        try:
+            with metrics.stage("lexical_search"):
+                hits = self._lexical_index.search(self._namespaces, query_str, self._candidates)
+        except Exception as e:
+            # The vector search alone still answers
+            self.logger.warning(f"Lexical search failed: {str(e)}")
+            hits = []
+        self._searched[query_str] = hits
+        return hits
+
+    def _confident(self, lexical: List[NodeWithScore]) -> bool:
+        # Scores are capped at 1, so two hits at the cap count as a tie
+        if self._fast_path_score is None or not lexical or (lexical[0].score or 0.0) < self._fast_path_score:
+            return False
+        return len(lexical) == 1 or (lexical[1].score or 0.0) * self._fast_path_ratio <= lexical[0].score
+
+    def fast_path(self, query_str: str) -> bool:
+        # Whether retrieval will skip the vector search for this query
+        return self._confident(self._lexical(query_str))
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical = self._lexical(query_bundle.query_str)
+        if self._confident(lexical):
+            metrics.RETRIEVAL_PATH.labels("lexical").inc()
+            return lexical[:self._similarity_top_k]
+
+        vector = self._vector_retriever.retrieve(query_bundle)
+        if not lexical:
+            metrics.RETRIEVAL_PATH.labels("vector").inc()
+            return vector[:self._similarity_top_k]
+        metrics.RETRIEVAL_PATH.labels("hybrid").inc()
+
+        fused: Dict[str, float] = {}
+        best: Dict[str, NodeWithScore] = {}
+        for ranked in (vector, lexical):
+            for rank, hit in enumerate(ranked, start=1):
+                node_id = hit.node.node_id
+                fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (self._rrf_k + rank)
+                if node_id not in best or (hit.score or 0.0) > (best[node_id].score or 0.0):
+                    best[node_id] = hit
+        ranked_ids = sorted(fused, key=fused.get, reverse=True)[:self._similarity_top_k]
+
+        self.logger.debug(
+            f"Fused {len(vector)} vector and {len(lexical)} lexical hits: "
+            + ", ".join(f"{node_id}={fused[node_id]:.4f}" for node_id in ranked_ids)
+        )
+        return [best[node_id] for node_id in ranked_ids]
@@ -0,0 +1,127 @@
+# ingest_jobs.py
+
+import os
+import asyncio
+import logging
+from typing import List, Optional
+from sqlalchemy import select, update
+from database import AsyncSessionLocal
+from models import IngestJob
+from executors import ExecutorBusy
+
+ACTIVE_STATUSES = ("queued", "parsing", "embedding", "upserting")
+
+
+class IngestJobQueue:
+    # Uploads are recorded as IngestJob rows and processed by a small pool of
+    # worker tasks, so POST /ingest returns as soon as the file is spooled.
+    # Jobs left unfinished by a restart are picked up again on start().
+    def __init__(self, rag_manager=None, workers: int = None):
+        self.logger = logging.getLogger(__name__)
+        self.rag_manager = rag_manager
+        self.workers = workers or int(os.getenv("INGEST_JOB_WORKERS", "2"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self, rag_manager=None):
+        # The manager may be handed over here when it's built after the queue
+        if rag_manager is not None:
+            self.rag_manager = rag_manager
+        self._queue = asyncio.Queue()
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(IngestJob.id)
+                .where(IngestJob.status.in_(ACTIVE_STATUSES))
+                .order_by(IngestJob.id)
+            )
+            pending = result.scalars().all()
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            self.logger.info(f"🔁 Re-queued {len(pending)} unfinished ingest jobs")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, chat_id: int, filename: str, file_path: str) -> IngestJob:
+        async with AsyncSessionLocal() as session:
+            job = IngestJob(
+                chat_id=chat_id,
+                filename=filename,
+                file_path=file_path,
+                status="queued"
+            )
+            session.add(job)
+            await session.commit()
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: int) -> Optional[IngestJob]:
+        async with AsyncSessionLocal() as session:
+            return await session.get(IngestJob, job_id)
+
+    async def _set_status(self, job_id: int, status: str, **fields):
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(IngestJob)
+                .where(IngestJob.id == job_id)
+                .values(status=status, **fields)
+            )
+            await session.commit()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"❌ Ingest job {job_id} crashed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: int):
+        job = await self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+
+        async def progress(stage: str):
+            await self._set_status(job_id, stage)
+
+        try:
+            while True:
+                try:
+                    # Keyed by job, so a job resumed after a restart
+                    # overwrites whatever it had already upserted
+                    chunks = await self.rag_manager.ingest_document(
+                        job.file_path,
+                        job.chat_id,
+                        progress=progress,
+                        file_name=job.filename,
+                        source_id=f"ingest_job_{job.id}"
+                    )
+                    break
+                except ExecutorBusy:
+                    # Webhook syncs share the ingest executor; wait for a slot
+                    await asyncio.sleep(1)
+            await self._set_status(job_id, "done", chunks=chunks)
+            self.logger.info(f"✅ Ingest job {job_id} done: {job.filename} ({chunks} chunks)")
+        except Exception as e:
+            await self._set_status(job_id, "failed", error=str(e))
+            self.logger.error(f"❌ Ingest job {job_id} failed: {str(e)}")
+
+        # Only reached once the job is done or failed; on shutdown the spooled
+        # file stays so the job can resume after a restart
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
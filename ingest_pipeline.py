@@ -0,0 +1,184 @@
+# ingest_pipeline.py
+
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from typing import Iterable, List
+import openai
+from llama_index.schema import MetadataMode, TextNode
+from executors import ExecutorBusy
+import metrics
+
+
+def is_rate_limited(error: Exception) -> bool:
+    if isinstance(error, openai.RateLimitError):
+        return True
+    # Pinecone and most HTTP clients expose the response status on the error
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return status == 429
+
+
+class IngestPipeline:
+    # Parse -> embed -> upsert as concurrent stages joined by bounded queues,
+    # so a large document takes about as long as its slowest stage rather
+    # than the sum of all three. Embedding and upserting run on the ingest
+    # executor; the producer that drives parsing runs on a pool of its own (see
+    # _feed). Upserted chunks also go into the lexical index, when there is one.
+    def __init__(self, embed_model, executor, lexical_index=None):
+        self.logger = logging.getLogger(__name__)
+        self.embed_model = embed_model
+        self.executor = executor
+        self.lexical_index = lexical_index
+        self.embed_batch_size = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+        self.embed_concurrency = int(os.getenv("EMBED_CONCURRENCY", "2"))
+        self.upsert_batch_size = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+        self.upsert_concurrency = int(os.getenv("UPSERT_CONCURRENCY", "2"))
+        self.queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+        self.max_retries = int(os.getenv("PIPELINE_MAX_RETRIES", "5"))
+        self._feeders = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv("PIPELINE_FEED_WORKERS", "8")),
+            thread_name_prefix="ingest-feed"
+        )
+
+    async def _run(self, fn, *args):
+        # Stages back off instead of failing when the executor is saturated
+        while True:
+            try:
+                return await self.executor.run(fn, *args)
+            except ExecutorBusy:
+                await asyncio.sleep(0.5)
+
+    async def _run_with_retries(self, fn, *args):
+        # For vector store writes: OpenAI calls are retried by their gateway
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._run(fn, *args)
+            except Exception as e:
+                if not is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.logger.warning(f"⏳ Rate limited in {fn.__name__}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    def _embed(self, batch: List[TextNode]):
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+        with metrics.stage("embed"):
+            embeddings = self.embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(batch, embeddings):
+            node.embedding = embedding
+
+    def _upsert(self, vector_store, batch: List[TextNode]):
+        with metrics.stage("upsert"):
+            vector_store.add(batch)
+        # Only once the vectors are in, so lexical hits always have them
+        if self.lexical_index is not None:
+            self.lexical_index.add(vector_store.namespace, batch)
+
+    def _feed(self, nodes: Iterable[TextNode], queue: asyncio.Queue, loop, stop: threading.Event):
+        # Drives the (possibly lazy) node iterator and blocks on the bounded
+        # queue, which is what throttles parsing. It runs on _feeders, not the
+        # ingest executor: enough concurrent pipelines would otherwise fill
+        # every ingest worker with blocked producers and leave none for the
+        # embed and upsert stages that drain their queues.
+        def put(batch):
+            future = asyncio.run_coroutine_threadsafe(queue.put(batch), loop)
+            while True:
+                try:
+                    return future.result(timeout=0.5)
+                except concurrent.futures.TimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        raise RuntimeError("Ingest pipeline stopped")
+
+        # Parse time excludes time spent blocked on the queue
+        batch = []
+        parse_time = 0.0
+        iterator = iter(nodes)
+        while True:
+            started = time.perf_counter()
+            node = next(iterator, None)
+            parse_time += time.perf_counter() - started
+            if node is None:
+                break
+            batch.append(node)
+            if len(batch) >= self.embed_batch_size:
+                put(batch)
+                batch = []
+        if batch:
+            put(batch)
+        metrics.observe("parse", parse_time)
+
+    async def run(self, nodes: Iterable[TextNode], vector_store, progress=None, source: str = "file") -> int:
+        # progress is an optional async callback, awaited once per stage name
+        # (parsing, embedding, upserting) when the first batch reaches it
+        loop = asyncio.get_running_loop()
+        embed_queue = asyncio.Queue(maxsize=self.queue_size)
+        upsert_queue = asyncio.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        reported = set()
+        upserted = 0
+        start_time = time.perf_counter()
+
+        async def report(stage: str):
+            if progress is not None and stage not in reported:
+                reported.add(stage)
+                await progress(stage)
+
+        async def parse():
+            await report("parsing")
+            context = contextvars.copy_context()
+            await asyncio.wrap_future(
+                self._feeders.submit(context.run, self._feed, nodes, embed_queue, loop, stop)
+            )
+            for _ in range(self.embed_concurrency):
+                await embed_queue.put(None)
+
+        async def embed():
+            pending = []
+            while (batch := await embed_queue.get()) is not None:
+                await report("embedding")
+                # OpenAI 429s are already retried by the embedding gateway
+                await self._run(self._embed, batch)
+                # Re-batch for the upsert stage, whose batch size may differ
+                pending.extend(batch)
+                while len(pending) >= self.upsert_batch_size:
+                    await upsert_queue.put(pending[:self.upsert_batch_size])
+                    pending = pending[self.upsert_batch_size:]
+            if pending:
+                await upsert_queue.put(pending)
+
+        async def upsert():
+            nonlocal upserted
+            while (batch := await upsert_queue.get()) is not None:
+                await report("upserting")
+                await self._run_with_retries(self._upsert, vector_store, batch)
+                upserted += len(batch)
+                metrics.CHUNKS.labels(source).inc(len(batch))
+
+        async def embed_stage():
+            await asyncio.gather(*(embed() for _ in range(self.embed_concurrency)))
+            for _ in range(self.upsert_concurrency):
+                await upsert_queue.put(None)
+
+        tasks = [
+            asyncio.create_task(parse()),
+            asyncio.create_task(embed_stage()),
+            *(asyncio.create_task(upsert()) for _ in range(self.upsert_concurrency))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            stop.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        duration = time.perf_counter() - start_time
+        self.logger.info(f"Ingest pipeline upserted {upserted} chunks in {duration:.2f} seconds")
+        return upserted
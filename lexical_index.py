@@ -0,0 +1,317 @@
+# lexical_index.py
+
+import io
+import os
+import re
+import json
+import math
+import logging
+import threading
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from llama_index.schema import BaseNode, MetadataMode, NodeWithScore
+from llama_index.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+# Words, numbers and compound identifiers (ERR-1042, user_id, v2.3.1,
+# api/v1). A compound is indexed whole and as its parts, so both "err-1042"
+# and "1042" find it.
+_TOKEN = re.compile(r"[^\W_]+(?:[-_.:/#][^\W_]+)*")
+_SEPARATOR = re.compile(r"[-_.:/#]")
+_MAX_TOKEN_CHARS = 64
+_STOPWORDS = frozenset("""
+    a about all also an and any are as at be been but by can could did do does
+    for from had has have how i if in into is it its just me my no not of on
+    or our so than that the their them then there these they this to us was
+    we were what when where which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > _MAX_TOKEN_CHARS or token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SEPARATOR.split(token) if part not in _STOPWORDS)
+    return tokens
+
+
+class _LexicalNamespace:
+    # BM25 index for one namespace, held as one pair of compact arrays per
+    # term (doc numbers as uint32, term frequencies as uint16) plus per-doc
+    # lengths in NumPy. On disk:
+    #   snapshot.npz - the same postings in CSR form (terms, offsets, docs,
+    #                  freqs), doc lengths and each doc's id and node
+    #   log.jsonl    - add/del records since the snapshot, replayed on load
+    # Deletes only tombstone a doc; the snapshot rewrite drops dead docs, and
+    # runs once the log holds snapshot_every records or dead docs outnumber
+    # live ones.
+    def __init__(self, path: str, k1: float, b: float, snapshot_every: int):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.snapshot_every = snapshot_every
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_nodes: List[Optional[str]] = []  # node_to_metadata_dict as JSON
+        self.id_to_doc: Dict[str, int] = {}
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.lengths = np.zeros(1024, dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.total_length = 0
+        self.log_records = 0
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.path, "snapshot.npz")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+
+    def __len__(self) -> int:
+        return len(self.id_to_doc)
+
+    def _load(self):
+        if os.path.exists(self._snapshot_path):
+            with np.load(self._snapshot_path) as snapshot:
+                terms = snapshot["terms"].tobytes().decode("utf-8")
+                offsets, docs, freqs = snapshot["offsets"], snapshot["docs"], snapshot["freqs"]
+                lengths = snapshot["lengths"]
+                for line in io.StringIO(snapshot["nodes"].tobytes().decode("utf-8")):
+                    record = json.loads(line)
+                    self._append_doc(record["id"], json.dumps(record["node"]), int(lengths[len(self.doc_ids)]))
+                for index, term in enumerate(terms.split("\n") if terms else []):
+                    start, end = offsets[index], offsets[index + 1]
+                    self.postings[term] = (array("I", docs[start:end].tobytes()), array("H", freqs[start:end].tobytes()))
+
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["op"] == "add":
+                        node = metadata_dict_to_node(record["node"])
+                        self._add(record["id"], tokenize(node.get_content(metadata_mode=MetadataMode.EMBED)), json.dumps(record["node"]))
+                    elif record["op"] == "del":
+                        self._remove(record["id"])
+                    self.log_records += 1
+
+    def _append_doc(self, node_id: str, node: str, length: int) -> int:
+        doc = len(self.doc_ids)
+        if doc == len(self.lengths):
+            self.lengths = np.concatenate([self.lengths, np.zeros(doc, dtype=np.float32)])
+            self.alive = np.concatenate([self.alive, np.zeros(doc, dtype=bool)])
+        self.doc_ids.append(node_id)
+        self.doc_nodes.append(node)
+        self.id_to_doc[node_id] = doc
+        self.lengths[doc] = length
+        self.alive[doc] = True
+        self.total_length += length
+        return doc
+
+    def _add(self, node_id: str, tokens: List[str], node: str):
+        self._remove(node_id)
+        doc = self._append_doc(node_id, node, len(tokens))
+        for term, count in Counter(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array("I"), array("H"))
+            postings[0].append(doc)
+            postings[1].append(min(count, 65535))
+
+    def _remove(self, node_id: str) -> bool:
+        doc = self.id_to_doc.pop(node_id, None)
+        if doc is None:
+            return False
+        self.doc_ids[doc] = None
+        self.doc_nodes[doc] = None
+        self.alive[doc] = False
+        self.total_length -= int(self.lengths[doc])
+        return True
+
+    def add(self, nodes: List[BaseNode]):
+        # Tokenising and serialising happen outside the lock
+        prepared = [
+            (
+                node.node_id,
+                tokenize(node.get_content(metadata_mode=MetadataMode.EMBED)),
+                node_to_metadata_dict(node, remove_text=False, flat_metadata=False)
+            )
+            for node in nodes
+        ]
+        with self._lock:
+            with open(self._log_path, "a", encoding="utf-8") as log:
+                for node_id, tokens, meta in prepared:
+                    node = json.dumps(meta)
+                    log.write(f'{{"op": "add", "id": {json.dumps(node_id)}, "node": {node}}}\n')
+                    self._add(node_id, tokens, node)
+                    self.log_records += 1
+            self._maybe_snapshot()
+
+    def delete(self, ids: Iterable[str]):
+        with self._lock:
+            with open(self._log_path, "a", encoding="utf-8") as log:
+                for node_id in ids:
+                    if self._remove(node_id):
+                        log.write(json.dumps({"op": "del", "id": node_id}) + "\n")
+                        self.log_records += 1
+            self._maybe_snapshot()
+
+    def missing(self, ids: Iterable[str]) -> Set[str]:
+        with self._lock:
+            return {node_id for node_id in ids if node_id not in self.id_to_doc}
+
+    def _maybe_snapshot(self):
+        dead = len(self.doc_ids) - len(self.id_to_doc)
+        if self.log_records < self.snapshot_every and dead < max(1000, len(self.id_to_doc)):
+            return
+
+        live = np.flatnonzero(self.alive[:len(self.doc_ids)])
+        renumber = np.full(len(self.doc_ids), -1, dtype=np.int64)
+        renumber[live] = np.arange(len(live))
+
+        terms, offsets, all_docs, all_freqs = [], [0], [], []
+        for term, (docs, freqs) in self.postings.items():
+            docs = np.array(docs, dtype=np.uint32)
+            keep = self.alive[docs]
+            if not keep.any():
+                continue
+            terms.append(term)
+            all_docs.append(renumber[docs[keep]].astype(np.uint32))
+            all_freqs.append(np.array(freqs, dtype=np.uint16)[keep])
+            offsets.append(offsets[-1] + int(keep.sum()))
+        nodes = "".join(
+            f'{{"id": {json.dumps(self.doc_ids[doc])}, "node": {self.doc_nodes[doc]}}}\n' for doc in live
+        )
+
+        # Written whole, then swapped in; a crash before the log is truncated
+        # only means its records are replayed again, which is idempotent
+        tmp = self._snapshot_path + ".tmp.npz"
+        np.savez(
+            tmp,
+            terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+            offsets=np.array(offsets, dtype=np.int64),
+            docs=np.concatenate(all_docs) if all_docs else np.zeros(0, dtype=np.uint32),
+            freqs=np.concatenate(all_freqs) if all_freqs else np.zeros(0, dtype=np.uint16),
+            lengths=self.lengths[live].astype(np.uint32),
+            nodes=np.frombuffer(nodes.encode("utf-8"), dtype=np.uint8)
+        )
+        os.replace(tmp, self._snapshot_path)
+        open(self._log_path, "w").close()
+
+        self._reset()
+        self._load()
+        self.logger.info(f"🧹 Snapshotted lexical namespace {self.path}: {len(self.id_to_doc)} docs, {len(self.postings)} terms")
+
+    def search(self, terms: List[str], top_k: int) -> List[Tuple[str, float, str]]:
+        # (node id, score, node JSON) for the best top_k docs. The score is
+        # BM25 divided by what a doc holding every query term once at average
+        # length would get, i.e. roughly the idf-weighted share of the query
+        # found, capped at 1.
+        with self._lock:
+            live = len(self.id_to_doc)
+            if live == 0 or not terms:
+                return []
+            average_length = max(self.total_length / live, 1.0)
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+            weight = 0.0
+            for term in terms:
+                postings = self.postings.get(term)
+                # df counts tombstoned docs until the next snapshot
+                df = len(postings[0]) if postings is not None else 0
+                idf = math.log(1 + (max(live - df, 0) + 0.5) / (df + 0.5))
+                weight += idf
+                if postings is None:
+                    continue
+                docs = np.array(postings[0], dtype=np.int64)
+                freqs = np.array(postings[1], dtype=np.float32)
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / average_length)
+                scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+
+            candidates = np.flatnonzero(scores > 0)
+            candidates = candidates[self.alive[candidates]]
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [
+                (self.doc_ids[doc], min(1.0, float(scores[doc]) / weight), self.doc_nodes[doc])
+                for doc in candidates
+            ]
+
+
+class LexicalIndex:
+    # Local BM25 index kept next to the vector store: one _LexicalNamespace
+    # per vector namespace under `path`, written by the same ingestion paths
+    # (IngestPipeline upserts, Notion chunk deletes) so the two hold the same
+    # chunks. Namespaces are loaded on first use.
+    def __init__(self, path: str = None, k1: float = None, b: float = None, snapshot_every: int = None):
+        self.path = path or os.getenv("LEXICAL_INDEX_PATH", "lexical_index")
+        self.k1 = k1 or float(os.getenv("LEXICAL_BM25_K1", "1.2"))
+        self.b = b if b is not None else float(os.getenv("LEXICAL_BM25_B", "0.75"))
+        self.snapshot_every = snapshot_every or int(os.getenv("LEXICAL_SNAPSHOT_EVERY", "5000"))
+        self._lock = threading.Lock()
+        self._namespaces: Dict[str, _LexicalNamespace] = {}
+        self.searches = 0
+
+    def namespace(self, namespace: str) -> _LexicalNamespace:
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                index = _LexicalNamespace(os.path.join(self.path, namespace), self.k1, self.b, self.snapshot_every)
+                self._namespaces[namespace] = index
+            return index
+
+    def has_namespace(self, namespace: str) -> bool:
+        with self._lock:
+            return namespace in self._namespaces or os.path.isdir(os.path.join(self.path, namespace))
+
+    def is_empty(self, namespace: str) -> bool:
+        return not self.has_namespace(namespace) or len(self.namespace(namespace)) == 0
+
+    def add(self, namespace: str, nodes: List[BaseNode]):
+        if nodes:
+            self.namespace(namespace).add(nodes)
+
+    def delete(self, namespace: str, ids: Iterable[str]):
+        if self.has_namespace(namespace):
+            self.namespace(namespace).delete(ids)
+
+    def missing(self, namespace: str, ids: Iterable[str]) -> Set[str]:
+        if not self.has_namespace(namespace):
+            return set(ids)
+        return self.namespace(namespace).missing(ids)
+
+    def search(self, namespaces: Iterable[str], query: str, top_k: int) -> List[NodeWithScore]:
+        # Best top_k across the namespaces, by normalised score
+        terms = list(dict.fromkeys(tokenize(query)))
+        self.searches += 1
+        hits: Dict[str, Tuple[float, str]] = {}
+        for namespace in namespaces:
+            # Don't create a namespace (every chat's is searched) just to find it empty
+            if not self.has_namespace(namespace):
+                continue
+            for node_id, score, node in self.namespace(namespace).search(terms, top_k):
+                if node_id not in hits or score > hits[node_id][0]:
+                    hits[node_id] = (score, node)
+        ranked = sorted(hits.values(), key=lambda hit: hit[0], reverse=True)[:top_k]
+        return [NodeWithScore(node=metadata_dict_to_node(json.loads(node)), score=score) for score, node in ranked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = dict(self._namespaces)
+        return {
+            "namespaces_loaded": len(namespaces),
+            "docs": sum(len(index) for index in namespaces.values()),
+            "terms": sum(len(index.postings) for index in namespaces.values()),
+            "searches": self.searches,
+        }
@@ -0,0 +1,346 @@
+# llm_gateway.py
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Optional
+
+import httpx
+from llama_index.embeddings import OpenAIEmbedding
+
+import metrics
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class GatewayDeadlineExceeded(httpx.PoolTimeout):
+    pass
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class TokenBucket:
+    # Refills continuously at per_minute / 60 per second, holding at most a
+    # minute's worth. Requests bigger than that are clamped so they can pass.
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount: float) -> float:
+        # Takes the tokens and returns 0, or returns how long until they'd be there
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+
+class _GatewayStream(httpx.SyncByteStream):
+    # Holds the concurrency slot until the body is read and closed, and
+    # stops a stream that runs past the request's deadline
+    def __init__(self, stream, release, deadline: float, request: httpx.Request):
+        self._stream = stream
+        self._release = release
+        self._deadline = deadline
+        self._request = request
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._stream:
+            if time.monotonic() > self._deadline:
+                raise httpx.ReadTimeout("LLM gateway deadline exceeded", request=self._request)
+            yield chunk
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self._stream.close()
+            finally:
+                self._release()
+
+
+class GatewayTransport(httpx.BaseTransport):
+    # httpx transport that every OpenAI call (chat and embeddings) goes
+    # through. Per call it:
+    #   - waits for request-per-minute and (estimated) token-per-minute budget
+    #     and a concurrency slot, but never past the call's deadline
+    #   - retries 429/5xx/connection errors with jittered exponential backoff,
+    #     honouring Retry-After, within the same deadline
+    #   - optionally hedges: if no response has arrived after the p95 of
+    #     recent response times, sends a second copy and keeps whichever
+    #     answers first
+    # Running out of deadline raises httpx timeouts, which the OpenAI SDK
+    # reports as APITimeoutError.
+    def __init__(
+        self,
+        name: str,
+        rpm: float = 0,
+        tpm: float = 0,
+        max_concurrency: int = 16,
+        deadline: float = 60.0,
+        max_retries: int = 4,
+        hedge: bool = False,
+        hedge_min_delay: float = 1.0,
+        transport: httpx.BaseTransport = None
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self._transport = transport or httpx.HTTPTransport()
+        self._requests = TokenBucket(rpm) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm) if tpm > 0 else None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-hedge") if hedge else None
+        self._latencies = deque(maxlen=256)
+        self._lock = threading.Lock()
+        self.inflight = 0
+        self.events = {
+            "requests": 0, "retries": 0, "rate_limited": 0, "throttled": 0,
+            "hedged": 0, "hedge_won": 0, "deadline_exceeded": 0
+        }
+        metrics.track_gateway(self)
+
+    @classmethod
+    def from_env(cls, name: str, prefix: str, **kwargs) -> "GatewayTransport":
+        # e.g. OPENAI_LLM_RPM, OPENAI_LLM_TPM, OPENAI_LLM_MAX_CONCURRENCY,
+        # OPENAI_LLM_DEADLINE_SECONDS, OPENAI_LLM_MAX_RETRIES, OPENAI_LLM_HEDGE,
+        # OPENAI_LLM_HEDGE_MIN_DELAY; 0 disables a rate limit
+        return cls(
+            name,
+            rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+            tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+            max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", "16")),
+            deadline=float(os.getenv(f"{prefix}_DEADLINE_SECONDS", "60")),
+            max_retries=int(os.getenv(f"{prefix}_MAX_RETRIES", "4")),
+            hedge=os.getenv(f"{prefix}_HEDGE", "0") == "1",
+            hedge_min_delay=float(os.getenv(f"{prefix}_HEDGE_MIN_DELAY", "1.0")),
+            **kwargs
+        )
+
+    def _count(self, event: str):
+        with self._lock:
+            self.events[event] += 1
+        metrics.GATEWAY_EVENTS.labels(self.name, event).inc()
+
+    @staticmethod
+    def _estimate_tokens(request: httpx.Request) -> float:
+        # ~4 characters per token, plus the completion budget for chat calls
+        try:
+            body = json.loads(request.content or b"{}")
+        except (ValueError, httpx.RequestNotRead):
+            return 1.0
+        if "messages" in body:
+            prompt = sum(len(str(message.get("content") or "")) for message in body["messages"])
+            return prompt / 4 + (body.get("max_tokens") or body.get("max_completion_tokens") or 256)
+        texts = body.get("input", "")
+        if isinstance(texts, str):
+            texts = [texts]
+        return sum(len(str(text)) for text in texts) / 4 or 1.0
+
+    def _deadline_error(self, request: httpx.Request) -> GatewayDeadlineExceeded:
+        self._count("deadline_exceeded")
+        return GatewayDeadlineExceeded(f"{self.name} gateway deadline of {self.deadline:g}s exceeded", request=request)
+
+    def _admit(self, request: httpx.Request, deadline: float, estimate: float, block: bool = True) -> bool:
+        # Rate budget first, then a concurrency slot. Budget taken by a call
+        # that then can't get a slot isn't returned; limits err on the safe side.
+        throttled = False
+        for bucket, amount in ((self._requests, 1.0), (self._tokens, estimate)):
+            if bucket is None:
+                continue
+            while (wait_for := bucket.try_acquire(amount)) > 0:
+                if not block:
+                    return False
+                if time.monotonic() + wait_for > deadline:
+                    raise self._deadline_error(request)
+                throttled = True
+                time.sleep(wait_for)
+        if throttled:
+            self._count("throttled")
+
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic()) if block else 0):
+            if not block:
+                return False
+            raise self._deadline_error(request)
+        with self._lock:
+            self.inflight += 1
+        return True
+
+    def _release(self):
+        with self._lock:
+            self.inflight -= 1
+        self._slots.release()
+
+    def _attempt(self, request: httpx.Request, deadline: float) -> httpx.Response:
+        # Runs with a slot already held; the slot goes back when the response
+        # is closed, or here if no response comes back
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._release()
+            raise self._deadline_error(request)
+        timeout = dict(request.extensions.get("timeout") or {})
+        for key in ("connect", "read", "write", "pool"):
+            timeout[key] = min(timeout.get(key) or remaining, remaining)
+        request.extensions["timeout"] = timeout
+
+        started = time.monotonic()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._release()
+            raise
+        if response.status_code < 400:
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+        response.stream = _GatewayStream(response.stream, self._release, deadline, request)
+        return response
+
+    def _hedge_delay(self) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 20:
+            return None
+        return max(self.hedge_min_delay, samples[int(len(samples) * 0.95) - 1])
+
+    def _send(self, request: httpx.Request, deadline: float, estimate: float) -> httpx.Response:
+        self._admit(request, deadline, estimate)
+        delay = self._hedge_delay() if self.hedge else None
+        if delay is None:
+            return self._attempt(request, deadline)
+
+        primary = self._hedge_pool.submit(self._attempt, request, deadline)
+        if wait([primary], timeout=delay).done or not self._admit(request, deadline, estimate, block=False):
+            return primary.result()
+
+        self._count("hedged")
+        hedge = self._hedge_pool.submit(self._attempt, request, deadline)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count("hedge_won")
+                    # Whatever is still running is closed when it lands,
+                    # which gives its slot back
+                    for loser in pending:
+                        loser.add_done_callback(_close_response)
+                    return future.result()
+        # Both failed; report the primary's error
+        return primary.result()
+
+    @staticmethod
+    def _retry_after(response: Optional[httpx.Response]) -> Optional[float]:
+        if response is None:
+            return None
+        try:
+            if "retry-after-ms" in response.headers:
+                return float(response.headers["retry-after-ms"]) / 1000
+            if "retry-after" in response.headers:
+                return float(response.headers["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        deadline = time.monotonic() + self.deadline
+        estimate = self._estimate_tokens(request)
+        self._count("requests")
+
+        for attempt in range(self.max_retries + 1):
+            response, error = None, None
+            try:
+                response = self._send(request, deadline, estimate)
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if response.status_code == 429:
+                    self._count("rate_limited")
+            except GatewayDeadlineExceeded:
+                raise
+            except httpx.TransportError as e:
+                error = e
+
+            delay = self._retry_after(response) or min(20.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+            if attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            self._count("retries")
+            self.logger.warning(
+                f"⏳ {self.name} call failed ({error or response.status_code}), retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._transport.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            events = dict(self.events)
+        delay = self._hedge_delay()
+        return {
+            **events,
+            "inflight": self.inflight,
+            "max_concurrency": self.max_concurrency,
+            "deadline_seconds": self.deadline,
+            "hedge": self.hedge,
+            "hedge_delay_seconds": round(delay, 3) if delay is not None else None,
+        }
+
+
+class GatewayEmbedding(OpenAIEmbedding):
+    # OpenAIEmbedding minus llama_index's retry decorator (up to 6 attempts
+    # over 60s) around every call. Its client should go through a
+    # GatewayTransport, whose retries and deadline are then the only ones.
+    def _create(self, texts: List[str], engine: str) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        data = self._get_client().embeddings.create(input=texts, model=engine, **self.additional_kwargs).data
+        return [d.embedding for d in data]
+
+    async def _acreate(self, texts: List[str], engine: str) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        response = await self._get_aclient().embeddings.create(input=texts, model=engine, **self.additional_kwargs)
+        return [d.embedding for d in response.data]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._create([query], self._query_engine)[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return (await self._acreate([query], self._query_engine))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._create([text], self._text_engine)[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._acreate([text], self._text_engine))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._create(texts, self._text_engine)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await self._acreate(texts, self._text_engine)
@@ -0,0 +1,355 @@
+# local_vector_store.py
+
+import os
+import json
+import shutil
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.bridge.pydantic import PrivateAttr
+from llama_index.schema import BaseNode
+from llama_index.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+
+def _matches(metadata: dict, filters: Optional[MetadataFilters]) -> bool:
+    if filters is None or not filters.filters:
+        return True
+
+    results = []
+    for f in filters.filters:
+        value = metadata.get(f.key)
+        operator = getattr(f, "operator", FilterOperator.EQ)
+        try:
+            if operator == FilterOperator.EQ:
+                results.append(value == f.value)
+            elif operator == FilterOperator.NE:
+                results.append(value != f.value)
+            elif operator == FilterOperator.GT:
+                results.append(value is not None and value > f.value)
+            elif operator == FilterOperator.GTE:
+                results.append(value is not None and value >= f.value)
+            elif operator == FilterOperator.LT:
+                results.append(value is not None and value < f.value)
+            elif operator == FilterOperator.LTE:
+                results.append(value is not None and value <= f.value)
+            elif operator == FilterOperator.IN:
+                results.append(value in f.value)
+            elif operator == FilterOperator.NIN:
+                results.append(value not in f.value)
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+        except TypeError:
+            results.append(False)
+
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    return all(results)
+
+
+class _Collection:
+    # One namespace on disk:
+    #   vectors.f32 - append-only float32 rows (L2-normalised), memory-mapped
+    #   log.jsonl   - append-only add/delete records carrying ids and metadata
+    # An upsert appends a new row and tombstones the old one; the files are
+    # compacted once dead rows outnumber live ones.
+    def __init__(self, path: str, mode: str, nprobe: int, ivf_min_rows: int):
+        self.logger = logging.getLogger(__name__)
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        self.dim = None
+        self.row_ids: List[Optional[str]] = []
+        self.row_meta: List[Optional[dict]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.alive = np.zeros(0, dtype=bool)
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ivf = None
+        self._load()
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.path, "vectors.f32")
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "log.jsonl")
+
+    def _load(self):
+        if not os.path.exists(self._log_path):
+            return
+        with open(self._log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["op"] == "add":
+                    self.dim = record["dim"]
+                    self._mark_deleted(record["id"])
+                    self.id_to_row[record["id"]] = len(self.row_ids)
+                    self.row_ids.append(record["id"])
+                    self.row_meta.append(record["meta"])
+                elif record["op"] == "del":
+                    self._mark_deleted(record["id"])
+        self.alive = np.array([row_id is not None for row_id in self.row_ids], dtype=bool)
+        self._remap()
+
+    def _mark_deleted(self, node_id: str):
+        row = self.id_to_row.pop(node_id, None)
+        if row is not None:
+            self.row_ids[row] = None
+            self.row_meta[row] = None
+        return row
+
+    def _remap(self):
+        rows = len(self.row_ids)
+        if rows == 0 or not os.path.exists(self._vectors_path):
+            self.vectors = np.zeros((0, self.dim or 0), dtype=np.float32)
+            return
+        self.vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def __len__(self) -> int:
+        return len(self.id_to_row)
+
+    def add(self, ids: List[str], embeddings: np.ndarray, metadata: List[dict]):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = embeddings.shape[1]
+            elif embeddings.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional embeddings, got {embeddings.shape[1]}")
+
+            alive = self.alive.copy()
+            with open(self._log_path, "a", encoding="utf-8") as log:
+                for node_id, meta in zip(ids, metadata):
+                    replaced = self._mark_deleted(node_id)
+                    if replaced is not None:
+                        alive[replaced] = False
+                    self.id_to_row[node_id] = len(self.row_ids)
+                    self.row_ids.append(node_id)
+                    self.row_meta.append(meta)
+                    log.write(json.dumps({"op": "add", "id": node_id, "dim": self.dim, "meta": meta}) + "\n")
+            with open(self._vectors_path, "ab") as f:
+                f.write(embeddings.tobytes())
+
+            self.alive = np.concatenate([alive, np.ones(len(ids), dtype=bool)])
+            self._remap()
+            self._maybe_compact()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            alive = self.alive.copy()
+            with open(self._log_path, "a", encoding="utf-8") as log:
+                for node_id in ids:
+                    row = self._mark_deleted(node_id)
+                    if row is not None:
+                        alive[row] = False
+                        log.write(json.dumps({"op": "del", "id": node_id}) + "\n")
+            self.alive = alive
+            self._maybe_compact()
+
+    def delete_where(self, key: str, value: Any):
+        with self._lock:
+            ids = [row_id for row_id, meta in zip(self.row_ids, self.row_meta)
+                   if row_id is not None and meta.get(key) == value]
+        self.delete(ids)
+
+    def _maybe_compact(self):
+        dead = len(self.row_ids) - len(self.id_to_row)
+        if dead < max(1000, len(self.id_to_row)):
+            return
+
+        rows = np.flatnonzero(self.alive)
+        vectors = np.array(self.vectors[rows]) if len(rows) else np.zeros((0, self.dim), dtype=np.float32)
+        tmp_vectors, tmp_log = self._vectors_path + ".tmp", self._log_path + ".tmp"
+        with open(tmp_vectors, "wb") as f:
+            f.write(vectors.tobytes())
+        with open(tmp_log, "w", encoding="utf-8") as log:
+            for row in rows:
+                log.write(json.dumps({"op": "add", "id": self.row_ids[row], "dim": self.dim, "meta": self.row_meta[row]}) + "\n")
+        os.replace(tmp_vectors, self._vectors_path)
+        os.replace(tmp_log, self._log_path)
+
+        self.row_ids = [self.row_ids[row] for row in rows]
+        self.row_meta = [self.row_meta[row] for row in rows]
+        self.id_to_row = {row_id: idx for idx, row_id in enumerate(self.row_ids)}
+        self.alive = np.ones(len(rows), dtype=bool)
+        self._ivf = None
+        self._remap()
+        self.logger.info(f"🧹 Compacted local vector namespace {self.path} to {len(rows)} rows")
+
+    def _build_ivf(self, vectors: np.ndarray, alive: np.ndarray):
+        # Spherical k-means over a sample of live rows; sqrt(N) lists
+        rows = np.flatnonzero(alive)
+        n_lists = int(min(4096, max(1, np.sqrt(len(rows)))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(rows, size=min(len(rows), 50 * n_lists), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(10):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for k in range(n_lists):
+                members = sample[assignment == k]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[k] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        assignment = np.empty(len(rows), dtype=np.int64)
+        for start in range(0, len(rows), 65536):
+            batch = rows[start:start + 65536]
+            assignment[start:start + len(batch)] = np.argmax(vectors[batch] @ centroids.T, axis=1)
+        lists = [rows[assignment == k] for k in range(n_lists)]
+        return centroids, lists, len(alive)
+
+    def _candidates(self, query: np.ndarray, vectors: np.ndarray, alive: np.ndarray) -> Optional[np.ndarray]:
+        # Rows to score in approximate mode; None means scan everything
+        if self.mode != "ivf" or alive.sum() < self.ivf_min_rows:
+            return None
+        with self._lock:
+            if self._ivf is None or len(alive) - self._ivf[2] > 0.2 * self._ivf[2]:
+                self._ivf = self._build_ivf(vectors, alive)
+            centroids, lists, built_rows = self._ivf
+        probes = np.argsort(-(centroids @ query))[:self.nprobe]
+        # Rows added since the lists were built are always scanned
+        candidates = np.concatenate([lists[k] for k in probes] + [np.arange(built_rows, len(alive))])
+        return candidates[alive[candidates]]
+
+    def query(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        with self._lock:
+            vectors, alive, row_ids, row_meta = self.vectors, self.alive, self.row_ids, self.row_meta
+        if len(self.id_to_row) == 0 or query.query_embedding is None:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+
+        q = np.asarray(query.query_embedding, dtype=np.float32)
+        q = q / max(np.linalg.norm(q), 1e-12)
+
+        candidates = self._candidates(q, vectors, alive)
+        if candidates is None:
+            candidates = np.flatnonzero(alive)
+        scores = vectors[candidates] @ q
+
+        node_ids = set(query.node_ids) if query.node_ids else None
+        doc_ids = set(query.doc_ids) if query.doc_ids else None
+        restricted = query.filters is not None or node_ids is not None or doc_ids is not None
+        top_k = query.similarity_top_k
+
+        if restricted or len(scores) <= top_k:
+            order = np.argsort(-scores)
+        else:
+            # Only the top_k need sorting when nothing can be filtered out
+            part = np.argpartition(-scores, top_k)[:top_k]
+            order = part[np.argsort(-scores[part])]
+
+        nodes, similarities, ids = [], [], []
+        for idx in order:
+            row = candidates[idx]
+            meta = row_meta[row]
+            if meta is None:
+                continue
+            if node_ids is not None and row_ids[row] not in node_ids:
+                continue
+            if doc_ids is not None and meta.get("ref_doc_id") not in doc_ids:
+                continue
+            if not _matches(meta, query.filters):
+                continue
+            nodes.append(metadata_dict_to_node(meta))
+            similarities.append(float(scores[idx]))
+            ids.append(row_ids[row])
+            if len(nodes) >= top_k:
+                break
+
+        return VectorStoreQueryResult(nodes=nodes, similarities=similarities, ids=ids)
+
+
+class LocalVectorIndex:
+    # In-process stand-in for a Pinecone index: one _Collection per namespace
+    # under `path`. mode is "exact" (brute-force cosine) or "ivf" (inverted
+    # file lists; nprobe lists are scanned per query).
+    def __init__(self, path: str = None, mode: str = None, nprobe: int = None, ivf_min_rows: int = None):
+        self.path = path or os.getenv("LOCAL_VECTOR_STORE_PATH", "local_vector_store")
+        self.mode = mode or os.getenv("LOCAL_VECTOR_STORE_MODE", "exact")
+        self.nprobe = nprobe or int(os.getenv("LOCAL_VECTOR_STORE_NPROBE", "8"))
+        self.ivf_min_rows = ivf_min_rows or int(os.getenv("LOCAL_VECTOR_STORE_IVF_MIN_ROWS", "20000"))
+        self._lock = threading.Lock()
+        self._collections: Dict[str, _Collection] = {}
+
+    def namespace(self, namespace: str) -> _Collection:
+        with self._lock:
+            collection = self._collections.get(namespace)
+            if collection is None:
+                collection = _Collection(
+                    os.path.join(self.path, namespace), self.mode, self.nprobe, self.ivf_min_rows
+                )
+                self._collections[namespace] = collection
+            return collection
+
+    def has_namespace(self, namespace: str) -> bool:
+        with self._lock:
+            return namespace in self._collections or os.path.isdir(os.path.join(self.path, namespace))
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._collections.pop(namespace, None)
+            shutil.rmtree(os.path.join(self.path, namespace), ignore_errors=True)
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {name: len(collection) for name, collection in self._collections.items()}
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    # Drop-in for PineconeVectorStore backed by a LocalVectorIndex
+    stores_text: bool = True
+    flat_metadata: bool = False
+    namespace: str
+
+    _index: LocalVectorIndex = PrivateAttr()
+
+    def __init__(self, local_index: LocalVectorIndex, namespace: str, **kwargs):
+        super().__init__(namespace=namespace, **kwargs)
+        self._index = local_index
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._index
+
+    @property
+    def _collection(self) -> _Collection:
+        return self._index.namespace(self.namespace)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        ids = [node.node_id for node in nodes]
+        metadata = [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in nodes]
+        self._collection.add(ids, np.array([node.get_embedding() for node in nodes]), metadata)
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._collection.delete_where("ref_doc_id", ref_doc_id)
+
+    def delete_ids(self, ids: List[str]):
+        self._collection.delete(ids)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        # Every chat's namespace is searched; don't create one just to find it empty
+        if not self._index.has_namespace(self.namespace):
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        return self._collection.query(query)
@@ -0,0 +1,133 @@
+# logging_setup.py
+
+import os
+import re
+import json
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+from typing import Optional
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and
+# is emitted as a structured field
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_REDACTIONS = [
+    # key=value / "key": "value" pairs whose key looks secret
+    (re.compile(r"""(?i)(["']?(?:authorization|api[_-]?key|x-api-key|token|secret|password|cookie)["']?\s*[:=]\s*["']?)(?:bearer\s+)?[^\s"',}]+"""), r"\1[REDACTED]"),
+    (re.compile(r"(?i)bearer\s+[a-z0-9._\-]+"), "Bearer [REDACTED]"),
+    # OpenAI / Notion / Pinecone style keys
+    (re.compile(r"\b(?:sk|secret|ntn|pcsk)[-_][A-Za-z0-9_\-]{8,}"), "[REDACTED]"),
+    # Credentials embedded in connection URLs
+    (re.compile(r"(\w+(?:\+\w+)?://[^:/@\s]+:)[^@\s]+@"), r"\1[REDACTED]@"),
+]
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class SamplingFilter(logging.Filter):
+    # Keeps a `rate` fraction of records below WARNING; warnings and errors
+    # are always kept. Runs in the calling thread, before any formatting.
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.rate >= 1.0 or random.random() < self.rate
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = redact(record.exc_text)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The stock prepare() formats the whole record in the caller; we only
+    # merge args into the message and leave formatting/redaction to the
+    # listener thread. Drops records instead of blocking when the queue is full.
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    # LOG_LEVEL: root level (default INFO)
+    # LOG_FORMAT: "json" (default) or "text"
+    # LOG_SAMPLE_RATE: fraction of INFO/DEBUG records kept (default 1.0)
+    # LOG_QUEUE_SIZE: records buffered before new ones are dropped
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        formatter = RedactingFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    output = logging.StreamHandler()
+    output.setFormatter(formatter)
+
+    # Request threads only enqueue; a single listener thread formats and writes
+    log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(float(os.getenv("LOG_SAMPLE_RATE", "1.0"))))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    # Library loggers that are chatty at INFO
+    for name in ("httpx", "httpcore", "urllib3", "aiosqlite", "sqlalchemy.engine", "pinecone", "openai"):
+        logging.getLogger(name).setLevel(max(logging.getLogger(name).getEffectiveLevel(), logging.WARNING))
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,15 +1,28 @@
 # main.py
 
 import os
+import json
 import logging
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+import anyio
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from database import get_db, init_db
+from sqlalchemy import select, insert, delete, func, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from typing import Dict, List, Optional, Tuple
+from database import get_db, init_db, AsyncSessionLocal
 from models import Chat, Message
 from schemas import MessageCreate, MessageResponse
-from utils import PineconeRAGManager
+from executors import ExecutorBusy, query_executor, ingest_executor, retrieval_executor
+from ingest_jobs import IngestJobQueue
+from notion_sync import NotionSyncScheduler
+from logging_setup import setup_logging
+import metrics
+import time
+import asyncio
+import tempfile
 import datetime
 import aiofiles
 
@@ -24,18 +37,124 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-rag_manager = PineconeRAGManager()
-logging.basicConfig(level=logging.INFO)
+# The RAG manager (llama_index/langchain imports, Pinecone client, possibly
+# index creation) is built in the background after startup so the server
+# can answer /health and /ready straight away. Routes that need it return
+# 503 until it's up; /ready says which dependency is still pending.
+rag_manager = None
+rag_init_task = None
+ingest_jobs = IngestJobQueue()
+notion_sync = NotionSyncScheduler()
+dependency_state = {
+    "database": {"state": "starting", "error": None},
+    "rag_manager": {"state": "starting", "error": None, "init_seconds": None}
+}
+metrics.track_executor(query_executor)
+metrics.track_executor(ingest_executor)
+metrics.track_executor(retrieval_executor)
+metrics.track_notion_sync(notion_sync)
+setup_logging()
+access_logger = logging.getLogger("access")
 
-@app.on_event("startup")
-async def startup_event():
+RAG_INIT_MAX_BACKOFF = float(os.getenv("RAG_INIT_MAX_BACKOFF", "30"))
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2"))
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "rag-app-uploads"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request: Request, exc: ExecutorBusy):
+    logging.warning(f"⛔ Rejected {request.method} {request.url.path}: {str(exc)}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
+
+class ServiceStarting(Exception):
+    pass
+
+@app.exception_handler(ServiceStarting)
+async def service_starting_handler(request: Request, exc: ServiceStarting):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service is starting, try again shortly"},
+        headers={"Retry-After": "2"}
+    )
+
+def get_rag_manager():
+    if rag_manager is None:
+        raise ServiceStarting()
+    return rag_manager
+
+def _build_rag_manager():
+    # Runs on a worker thread: the import itself is a large part of the cost
+    from utils import PineconeRAGManager
+    return PineconeRAGManager()
+
+async def _initialise_dependencies():
+    global rag_manager
+    backoff = 1.0
+    # Steps that succeeded aren't repeated on retry: a second manager would
+    # start a second parse pool and gateways, a second ingest_jobs.start a
+    # second set of workers
+    manager = None
+    jobs_started = False
+    init_seconds = None
     try:
-        await init_db()
-        logging.info("✅ Database initialized successfully")
-    except Exception as e:
-        logging.error(f"❌ Database initialization failed: {str(e)}")
+        while True:
+            try:
+                if dependency_state["database"]["state"] != "ready":
+                    await init_db()
+                    dependency_state["database"] = {"state": "ready", "error": None}
+                    logging.info("✅ Database initialized successfully")
+
+                if manager is None:
+                    started = time.perf_counter()
+                    manager = await anyio.to_thread.run_sync(_build_rag_manager)
+                    init_seconds = round(time.perf_counter() - started, 2)
+                if not jobs_started:
+                    await ingest_jobs.start(manager)
+                    jobs_started = True
+                notion_sync.start(manager)
+                rag_manager = manager
+                dependency_state["rag_manager"] = {
+                    "state": "ready",
+                    "error": None,
+                    "init_seconds": init_seconds
+                }
+                logging.info(f"✅ RAG manager ready, started {ingest_jobs.workers} ingest workers")
+                return
+            except Exception as e:
+                failed = "database" if dependency_state["database"]["state"] != "ready" else "rag_manager"
+                dependency_state[failed].update(state="failed", error=str(e))
+                logging.error(f"❌ {failed} initialization failed, retrying in {backoff:.0f}s: {str(e)}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RAG_INIT_MAX_BACKOFF)
+    except asyncio.CancelledError:
+        # Shut down before the manager was handed over, so shutdown_event
+        # won't stop its parse workers
+        if manager is not None and rag_manager is not manager:
+            manager.document_parser.shutdown()
         raise
 
+@app.on_event("startup")
+async def startup_event():
+    global rag_init_task
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    rag_init_task = asyncio.create_task(_initialise_dependencies())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if rag_init_task is not None:
+        rag_init_task.cancel()
+        await asyncio.gather(rag_init_task, return_exceptions=True)
+    await ingest_jobs.stop()
+    await notion_sync.stop()
+    if rag_manager is not None:
+        rag_manager.document_parser.shutdown()
+
 @app.on_event("startup")
 async def print_routes():
     logging.info("🛣️ Registered routes:")
@@ -50,197 +169,475 @@ async def create_chat(db: AsyncSession = Depends(get_db)):
     await db.refresh(new_chat)
     return {"chat_id": new_chat.id}
 
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 500
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as HTTP requires for If-None-Match
+    return "*" in candidates or etag.removeprefix("W/") in [tag.removeprefix("W/") for tag in candidates]
+
 @app.get("/chat/{chat_id}")
-async def get_chat(chat_id: int, db: AsyncSession = Depends(get_db)):
-    # Get chat with messages
+async def get_chat(
+    chat_id: int,
+    request: Request,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=MESSAGES_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    # Pages of messages keyed on message id. With no cursor (or `before`)
+    # this returns the newest `limit` messages older than the cursor; with
+    # `after` the oldest `limit` messages newer than it. Either way the page
+    # is returned oldest first.
+    #
+    # A single query: the chat row is outer-joined to its page of messages
+    # (no rows at all means the chat doesn't exist), and carries the chat's
+    # latest message id for the ETag.
+    latest_id = (
+        select(func.max(Message.id))
+        .where(Message.chat_id == Chat.id)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    page_filter = [Message.chat_id == Chat.id]
+    if before is not None:
+        page_filter.append(Message.id < before)
+    if after is not None:
+        page_filter.append(Message.id > after)
+    newest_first = after is None
+
     result = await db.execute(
-        select(Chat)
+        select(latest_id.label("latest_id"), Message.id, Message.sender, Message.content)
+        .select_from(Chat)
+        .outerjoin(Message, and_(*page_filter))
         .where(Chat.id == chat_id)
+        .order_by(Message.id.desc() if newest_first else Message.id)
+        .limit(limit + 1)
     )
-    chat = result.scalar_one_or_none()
-    
-    if not chat:
+    rows = result.all()
+
+    if not rows:
         raise HTTPException(status_code=404, detail="Chat not found")
-    
-    # Get messages for chat
-    result = await db.execute(
-        select(Message)
-        .where(Message.chat_id == chat_id)
-        .order_by(Message.created_at)
-    )
-    messages = result.scalars().all()
-    
-    return {
-        "chat_id": chat_id,
-        "messages": [
-            {
-                "message_id": msg.id,
-                "sender": msg.sender,
-                "content": msg.content
-            } for msg in messages
-        ]
-    }
 
-@app.get("/chats")
-async def get_all_chats(db: AsyncSession = Depends(get_db)):
-    # Get all chats with their messages
-    result = await db.execute(
-        select(Chat).order_by(Chat.created_at.desc())
-    )
-    chats = result.scalars().all()
-    
-    chat_list = []
-    for chat in chats:
-        # Get messages for each chat
-        messages_result = await db.execute(
-            select(Message)
-            .where(Message.chat_id == chat.id)
-            .order_by(Message.created_at)
-        )
-        messages = messages_result.scalars().all()
-        
-        chat_list.append({
-            "id": chat.id,
+    # Messages are never edited, so the newest id identifies the history;
+    # the page parameters are part of the representation too
+    etag = f'W/"{chat_id}-{rows[0].latest_id or 0}-{before}-{after}-{limit}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    messages = [row for row in rows if row.id is not None]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if newest_first:
+        messages.reverse()
+
+    return JSONResponse(
+        content={
+            "chat_id": chat_id,
             "messages": [
                 {
-                    "content": msg.content,
-                    "sender": msg.sender
+                    "message_id": msg.id,
+                    "sender": msg.sender,
+                    "content": msg.content
                 } for msg in messages
-            ]
-        })
-    
-    return chat_list
+            ],
+            "has_more": has_more
+        },
+        headers=headers
+    )
 
-@app.post("/message")
-async def post_message(message: MessageCreate, db: AsyncSession = Depends(get_db)):
-    try:
-        # Verify chat exists
-        result = await db.execute(
-            select(Chat).where(Chat.id == message.chat_id)
-        )
-        chat = result.scalar_one_or_none()
-        if not chat:
-            raise HTTPException(status_code=404, detail="Chat not found")
+CHATS_PAGE_SIZE = 50
+CHATS_MAX_PAGE_SIZE = 200
+CHAT_PREVIEW_CHARS = 100
 
-        # Save user message
-        user_message = Message(
-            chat_id=message.chat_id,
-            sender="user",
-            content=message.input
+@app.get("/chats")
+async def get_all_chats(
+    limit: int = Query(CHATS_PAGE_SIZE, ge=1, le=CHATS_MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # One query per page: newest chats first, each with a preview of its
+    # first message picked by a correlated subquery on (chat_id, created_at).
+    # The cursor is the id of the last chat on the previous page; its
+    # created_at is looked up inside the same query, so timestamps never
+    # round-trip through the client.
+    first_message = (
+        select(Message.id)
+        .where(Message.chat_id == Chat.id)
+        .order_by(Message.created_at, Message.id)
+        .limit(1)
+        .correlate(Chat)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Chat.id,
+            Chat.created_at,
+            func.substr(Message.content, 1, CHAT_PREVIEW_CHARS).label("preview"),
+            Message.sender
         )
-        db.add(user_message)
-        await db.commit()
-        await db.refresh(user_message)
+        .outerjoin(Message, Message.id == first_message)
+        .order_by(Chat.created_at.desc(), Chat.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        anchor = aliased(Chat)
+        cursor_created_at = select(anchor.created_at).where(anchor.id == cursor).scalar_subquery()
+        query = query.where(or_(
+            Chat.created_at < cursor_created_at,
+            and_(Chat.created_at == cursor_created_at, Chat.id < cursor)
+        ))
+
+    rows = (await db.execute(query)).all()
+    page = rows[:limit]
+    next_cursor = page[-1].id if len(rows) > limit else None
 
-        # Generate response
+    return {
+        "chats": [
+            {
+                "id": row.id,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "preview": {"content": row.preview, "sender": row.sender} if row.preview is not None else None
+            } for row in page
+        ],
+        "next_cursor": next_cursor
+    }
+
+async def _insert_messages(chat_id: int, messages: List[Tuple[str, str]]) -> Dict[str, int]:
+    # One INSERT ... RETURNING for all (sender, content) rows in a short
+    # transaction of its own. There is no separate existence check: the
+    # chat_id foreign key rejects unknown chats, which we report as a 404.
+    with metrics.stage("db"):
+        async with AsyncSessionLocal() as session:
+            try:
+                result = await session.execute(
+                    insert(Message)
+                    .values([
+                        {"chat_id": chat_id, "sender": sender, "content": content}
+                        for sender, content in messages
+                    ])
+                    .returning(Message.id, Message.sender)
+                )
+                ids = {row.sender: row.id for row in result}
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                raise HTTPException(status_code=404, detail="Chat not found")
+    return ids
+
+async def _delete_message(message_id: int):
+    with metrics.stage("db"):
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(Message).where(Message.id == message_id))
+            await session.commit()
+
+@app.post("/message")
+async def post_message(message: MessageCreate):
+    # Reject before doing anything if the query executor is saturated
+    rag_manager = get_rag_manager()
+    rag_manager.query_executor.check_capacity()
+
+    try:
+        # Generate first with no DB connection checked out, then write the
+        # user and assistant messages together in one statement. A request
+        # rejected mid-way (ExecutorBusy) leaves nothing behind to duplicate
+        # on retry; the cost is that an unknown chat_id is only detected
+        # after generation.
         response = await rag_manager.generate_response(
             message.input,
             message.chat_id
         )
 
-        # Save assistant message
-        assistant_message = Message(
-            chat_id=message.chat_id,
-            sender="assistant",
-            content=response
-        )
-        db.add(assistant_message)
-        await db.commit()
-        await db.refresh(assistant_message)
+        ids = await _insert_messages(message.chat_id, [
+            ("user", message.input),
+            ("assistant", response)
+        ])
 
         return MessageResponse(
             chat_id=message.chat_id,
-            message_id=assistant_message.id,
+            message_id=ids["assistant"],
             response=response
         )
 
+    except (ExecutorBusy, HTTPException):
+        raise
     except Exception as e:
-        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/ingest")
-async def ingest(chat_id: int, file: UploadFile = File(...)):
-    content = await file.read()
-    temp_filename = f"temp_{file.filename}"
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+async def _save_assistant_message(chat_id: int, content: str):
+    if not content:
+        return None
+    ids = await _insert_messages(chat_id, [("assistant", content)])
+    return ids["assistant"]
+
+@app.post("/message/stream")
+async def post_message_stream(message: MessageCreate):
+    rag_manager = get_rag_manager()
+    rag_manager.query_executor.check_capacity()
+
+    # The user message is saved before streaming starts so an unknown chat
+    # still gets a proper 404 rather than a broken event stream. If the
+    # request then goes unanswered (rejected by the executor, or generation
+    # fails) it's deleted again, so a retry doesn't leave a duplicate behind.
+    ids = await _insert_messages(message.chat_id, [("user", message.input)])
 
-    logging.info(f"🚀 Ingesting file: {file.filename}")
-    
     try:
-        # Use async file operations
-        async with aiofiles.open(temp_filename, "wb") as f:
-            await f.write(content)
-        
-        await rag_manager.ingest_document(temp_filename, chat_id)
-        return {"success": True}
-        
+        token_stream = rag_manager.stream_response(message.input, message.chat_id)
+    except ExecutorBusy:
+        await _delete_message(ids["user"])
+        raise
+
+    async def event_stream():
+        tokens = []
+        error = None
+        message_id = None
+        try:
+            async for token in token_stream:
+                tokens.append(token)
+                yield _sse({"token": token})
+        except ExecutorBusy as e:
+            # What /message answers with a 503; the headers are already sent
+            error = {"detail": str(e), "retry_after": 1}
+        except Exception as e:
+            error = {"detail": f"An error occurred while generating the response: {str(e)}"}
+        finally:
+            # Runs on normal completion and on client disconnect; shield it so
+            # the cancellation that signals a disconnect doesn't abort the write.
+            # A failed generation isn't an answer, so nothing is saved and
+            # the user message is taken back out.
+            with anyio.CancelScope(shield=True):
+                try:
+                    if error is None:
+                        message_id = await _save_assistant_message(message.chat_id, "".join(tokens))
+                    else:
+                        await _delete_message(ids["user"])
+                except Exception as e:
+                    logging.error(f"❌ Failed to record streamed exchange for chat {message.chat_id}: {str(e)}")
+
+        if error is not None:
+            yield _sse(error, event="error")
+            return
+
+        yield _sse({
+            "chat_id": message.chat_id,
+            "message_id": message_id,
+            "response": "".join(tokens)
+        }, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _spool_extension(filename: str) -> str:
+    # Only the extension of the client's filename is used (for loader
+    # dispatch); the name itself never touches the filesystem
+    extension = os.path.splitext(os.path.basename(filename or ""))[1].lower()
+    return extension if extension[1:].isalnum() else ""
+
+@app.post("/ingest", status_code=202)
+async def ingest(chat_id: int, request: Request, file: UploadFile = File(...)):
+    # Reject oversized uploads up front when the client tells us the size
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+
+    # Jobs can only be queued once the workers are running
+    get_rag_manager()
+
+    logging.info(f"🚀 Queueing file for ingestion: {file.filename}")
+
+    # The job outlives this request, so spool to a unique file that the
+    # worker removes once it's done
+    fd, spool_path = tempfile.mkstemp(suffix=_spool_extension(file.filename), dir=UPLOAD_DIR)
+    os.close(fd)
+
+    try:
+        # Copy in fixed-size chunks so memory stays flat whatever the file size
+        size = 0
+        async with aiofiles.open(spool_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File exceeds {MAX_UPLOAD_BYTES} bytes")
+                await f.write(chunk)
+
+        job = await ingest_jobs.submit(chat_id, file.filename, spool_path)
+        return {"success": True, "job_id": job.id, "status": job.status}
+
+    except HTTPException:
+        os.remove(spool_path)
+        raise
     except Exception as e:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
 
-@app.post("/webhook/notion")
+@app.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: int):
+    job = await ingest_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+
+    return {
+        "job_id": job.id,
+        "chat_id": job.chat_id,
+        "filename": job.filename,
+        "status": job.status,
+        "chunks": job.chunks,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+@app.post("/webhook/notion", status_code=202)
 async def notion_webhook(request: Request):
-    logging.info("⭐ Entering webhook endpoint")
+    # Acknowledged immediately; notion_sync coalesces bursts of events for a
+    # page and re-indexes it once the page goes quiet
+    get_rag_manager()
     try:
-        body = await request.body()
-        logging.info(f"Raw request body: {body}")
-        
-        headers = dict(request.headers)
-        logging.info(f"Request headers: {headers}")
-        
         payload = await request.json()
-        logging.info(f"Parsed payload: {payload}")
+        logging.debug(f"Webhook event: source={payload.get('source', {}).get('type')} type={payload.get('type')}")
         
+        page_id = None
         # Handle automation events
         if payload.get("source", {}).get("type") == "automation":
             page_id = payload.get("data", {}).get("id")
-            if page_id:
-                logging.info(f"🔄 Processing page update for ID: {page_id}")
-                index = await rag_manager.update_notion_page(page_id)
-                return {"success": True, "index_id": str(index.index_id)}
-        
         # Handle direct page updates
-        if payload.get("type") == "page_updated":
+        elif payload.get("type") == "page_updated":
             page_id = payload.get("page", {}).get("id")
-            if page_id:
-                logging.info(f"🔄 Processing direct page update for ID: {page_id}")
-                await rag_manager.update_notion_page(page_id)
-                return {"success": True}
-        
-        logging.info("⏭️ Skipping non-page event")
-        return {"success": True, "message": "Event type not handled"}
+
+        if not page_id:
+            logging.info("⏭️ Skipping non-page event")
+            return {"success": True, "message": "Event type not handled"}
+
+        coalesced = notion_sync.submit(page_id)
+        logging.info(f"🔄 Queued Notion page {page_id} for sync{' (coalesced)' if coalesced else ''}")
+        return {"success": True, "page_id": page_id, "coalesced": coalesced, "pending": notion_sync.stats()["pending"]}
         
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    except ExecutorBusy:
+        raise
     except Exception as e:
         logging.error(f"❌ Webhook error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logging.info(f"🚀 Request received: {request.method} {request.url}")
-    logging.info(f"🔑 Headers: {dict(request.headers)}")
+async def record_metrics(request: Request, call_next):
+    trace = None
+    if metrics.TRACE_ALL or request.headers.get("x-trace"):
+        trace = metrics.start_trace()
+
+    started = time.perf_counter()
+    status = 500
+    metrics.REQUESTS_IN_PROGRESS.inc()
     try:
         response = await call_next(request)
-        logging.info(f"✅ Response status: {response.status_code}")
+        status = response.status_code
+        if trace is not None:
+            # Streaming responses only carry the spans recorded before the body starts
+            response.headers["Server-Timing"] = trace.server_timing()
         return response
-    except Exception as e:
-        logging.error(f"❌ Middleware error: {str(e)}")
-        raise
+    finally:
+        metrics.REQUESTS_IN_PROGRESS.dec()
+        # Label by route template, not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        route = route.path if route is not None else "unmatched"
+        duration = time.perf_counter() - started
+        metrics.REQUEST_DURATION.labels(request.method, route, status).observe(duration)
+        metrics.REQUESTS.labels(request.method, route, status).inc()
+        # One structured line per request; no headers, query strings or bodies
+        access_logger.info(
+            f"{request.method} {route} {status} {duration * 1000:.1f}ms",
+            extra={"method": request.method, "route": route, "status": status, "duration_ms": round(duration * 1000, 1)}
+        )
+        if trace is not None:
+            logging.info(f"🧭 Trace {request.method} {route} ({duration * 1000:.1f} ms): {trace.as_dict()}")
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
 
 @app.get("/health")
 async def health_check():
-    logging.info("🏥 Health check endpoint hit")
     return {
         "status": "healthy",
         "timestamp": datetime.datetime.now().isoformat(),
-        "environment": os.getenv("ENVIRONMENT", "development")
+        "environment": os.getenv("ENVIRONMENT", "development"),
+        "executors": {
+            "query": query_executor.stats(),
+            "ingest": ingest_executor.stats(),
+            "retrieval": retrieval_executor.stats()
+        },
+        "embedding_cache": rag_manager.embedding_cache.stats() if rag_manager else None,
+        "answer_cache": rag_manager.answer_cache.stats() if rag_manager else None,
+        "context": rag_manager.context_assembler.stats() if rag_manager else None,
+        "chunking": rag_manager.chunker.stats() if rag_manager else None,
+        "lexical_index": rag_manager.lexical_index.stats() if rag_manager and rag_manager.lexical_index else None,
+        "llm_gateways": {
+            "llm": rag_manager.llm_gateway.stats(),
+            "embedding": rag_manager.embedding_gateway.stats()
+        } if rag_manager else None,
+        "ingest_jobs_pending": ingest_jobs.pending,
+        "notion_sync": notion_sync.stats()
     }
 
+async def _check_dependency(check) -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout=READY_CHECK_TIMEOUT)
+        return {"state": "ready", "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+    except asyncio.TimeoutError:
+        return {"state": "unavailable", "error": f"timed out after {READY_CHECK_TIMEOUT}s"}
+    except Exception as e:
+        return {"state": "unavailable", "error": str(e)}
+
+async def _ping_database():
+    async with AsyncSessionLocal() as session:
+        await session.execute(select(1))
+
+async def _ping_vector_store():
+    await anyio.to_thread.run_sync(rag_manager.check_vector_store)
+
+@app.get("/ready")
+async def readiness_check():
+    # Unlike /health (is the process alive), this says whether we can serve
+    # traffic: initialisation finished and the database and vector store
+    # answer right now. 503 until everything is ready.
+    database = dict(dependency_state["database"])
+    if database["state"] == "ready":
+        database = await _check_dependency(_ping_database)
+    dependencies = {
+        "database": database,
+        "rag_manager": dict(dependency_state["rag_manager"])
+    }
+    if rag_manager is not None:
+        dependencies["vector_store"] = await _check_dependency(_ping_vector_store)
+    else:
+        dependencies["vector_store"] = {"state": "starting"}
+
+    ready = all(dependency["state"] == "ready" for dependency in dependencies.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "dependencies": dependencies}
+    )
+
 @app.get("/webhook/notion/health")
 async def webhook_health():
-    logging.info("🏥 Webhook health check endpoint hit")
     return {
         "status": "webhook endpoint healthy",
-        "timestamp": datetime.datetime.now().isoformat()
+        "timestamp": datetime.datetime.now().isoformat(),
+        "notion_sync": notion_sync.stats()
     }
 
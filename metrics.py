@@ -0,0 +1,106 @@
+# metrics.py
+
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Request latency is measured until the response starts, so for streaming
+# routes it covers admission and retrieval rather than the whole stream
+REQUEST_DURATION = Histogram(
+    "rag_request_duration_seconds",
+    "Time until the response starts, by route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+REQUESTS = Counter("rag_requests_total", "Requests handled, by route", ["method", "route", "status"])
+REQUESTS_IN_PROGRESS = Gauge("rag_requests_in_progress", "Requests currently being handled")
+
+# db, retrieval, lexical_search, llm_first_token, llm_total, parse, embed, upsert, notion_fetch
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each stage of query and ingestion work",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+LLM_TOKENS = Counter("rag_llm_tokens_total", "LLM tokens, by kind", ["kind"])  # prompt / completion
+CHUNKS = Counter("rag_ingested_chunks_total", "Chunks embedded and upserted, by source", ["source"])  # file / notion
+RETRIEVAL_SKIPPED = Counter(
+    "rag_retrieval_namespaces_skipped_total", "Namespaces left out of a merged retrieval, by reason", ["reason"]
+)  # timeout / error
+RETRIEVAL_PATH = Counter("rag_retrieval_path_total", "Queries by how their chunks were retrieved", ["path"])  # hybrid / vector / lexical
+EXECUTOR_INFLIGHT = Gauge("rag_executor_inflight", "Calls running or queued on a bounded executor", ["executor"])
+EXECUTOR_REJECTED = Gauge("rag_executor_rejected", "Calls rejected by a full executor since start", ["executor"])
+# requests / retries / rate_limited / throttled / hedged / hedge_won / deadline_exceeded
+GATEWAY_EVENTS = Counter("rag_llm_gateway_events_total", "OpenAI gateway events, by gateway", ["gateway", "event"])
+GATEWAY_INFLIGHT = Gauge("rag_llm_gateway_inflight", "OpenAI calls holding a gateway slot", ["gateway"])
+# pending / running pages, and received / coalesced / processed / unchanged / failed since start
+NOTION_SYNC = Gauge("rag_notion_sync", "Notion webhook sync scheduler state", ["stat"])
+
+# Per-request trace: (stage, start offset, duration) spans, collected when
+# METRICS_TRACE=1 or the request sends X-Trace. BoundedExecutor copies the
+# context into its threads, so stages that run there are captured too.
+TRACE_ALL = os.getenv("METRICS_TRACE", "0") == "1"
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, stage: str, started: float, duration: float):
+        self.spans.append((stage, started - self.start, duration))
+
+    def server_timing(self) -> str:
+        # Server-Timing header (shown in browser dev tools); durations in ms
+        return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, _, duration in self.spans)
+
+    def as_dict(self) -> list:
+        return [
+            {"stage": stage, "start_ms": round(offset * 1000, 1), "duration_ms": round(duration * 1000, 1)}
+            for stage, offset, duration in self.spans
+        ]
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def observe(stage: str, seconds: float, started: Optional[float] = None):
+    STAGE_DURATION.labels(stage).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, started if started is not None else time.perf_counter() - seconds, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, started)
+
+
+def track_executor(executor):
+    EXECUTOR_INFLIGHT.labels(executor.name).set_function(lambda: executor.inflight)
+    EXECUTOR_REJECTED.labels(executor.name).set_function(lambda: executor.rejected)
+
+
+def track_gateway(gateway):
+    GATEWAY_INFLIGHT.labels(gateway.name).set_function(lambda: gateway.inflight)
+
+
+def track_notion_sync(scheduler):
+    for stat in ("pending", "running", "received", "coalesced", "processed", "unchanged", "failed"):
+        NOTION_SYNC.labels(stat).set_function(lambda stat=stat: scheduler.stats()[stat])
+
+
+def render() -> Tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
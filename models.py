@@ -1,6 +1,6 @@
 # models.py
 
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text, JSON, Index
 from sqlalchemy.orm import relationship, declarative_base
 from sqlalchemy.sql import func
 
@@ -23,3 +23,29 @@ class Message(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     chat = relationship("Chat", back_populates="messages")
+
+    __table_args__ = (
+        # Every read of a chat's history filters by chat and orders by time
+        Index("ix_messages_chat_id_created_at", "chat_id", "created_at"),
+    )
+
+class NotionPageState(Base):
+    __tablename__ = "notion_page_states"
+
+    page_id = Column(String, primary_key=True)
+    last_edited_time = Column(String)
+    chunk_ids = Column(JSON, nullable=False, default=list)  # Vector IDs currently in Pinecone
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(Integer)
+    filename = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)  # Spooled upload, removed once the job finishes
+    status = Column(String, nullable=False, default="queued")  # queued/parsing/embedding/upserting/done/failed
+    chunks = Column(Integer)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
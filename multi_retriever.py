@@ -0,0 +1,82 @@
+# multi_retriever.py
+
+import time
+import logging
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Dict, List, Optional
+
+from llama_index.core.base_retriever import BaseRetriever
+from llama_index.schema import NodeWithScore, QueryBundle
+
+import metrics
+from executors import ExecutorBusy
+
+
+class MultiNamespaceRetriever(BaseRetriever):
+    # Searches several namespaces for one query at the same time and merges
+    # the hits by score into a single top-k. The query is embedded once and
+    # the same embedding is sent to every namespace. A namespace that hasn't
+    # answered by the deadline (or fails) is skipped, so one slow namespace
+    # costs at most `timeout` and never fails the whole query.
+    def __init__(
+        self,
+        retrievers: Dict[str, BaseRetriever],
+        executor,
+        similarity_top_k: int,
+        timeout: float,
+        embed_model=None
+    ):
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self._retrievers = retrievers
+        self._executor = executor
+        self._similarity_top_k = similarity_top_k
+        self._timeout = timeout
+        self._embed_model = embed_model
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None and self._embed_model is not None:
+            with metrics.stage("query_embedding"):
+                query_bundle.embedding = self._embed_model.get_query_embedding(query_bundle.query_str)
+
+        futures, results = {}, {}
+        for namespace, retriever in self._retrievers.items():
+            try:
+                futures[namespace] = self._executor.submit(retriever.retrieve, query_bundle)
+            except ExecutorBusy:
+                # Pool is saturated: search this namespace on the caller's thread
+                results[namespace] = self._search_inline(namespace, retriever, query_bundle)
+
+        deadline = time.monotonic() + self._timeout
+        for namespace, future in futures.items():
+            try:
+                results[namespace] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                future.cancel()
+                metrics.RETRIEVAL_SKIPPED.labels("timeout").inc()
+                self.logger.warning(f"⏱️ Retrieval from namespace {namespace} timed out after {self._timeout}s")
+            except Exception as e:
+                metrics.RETRIEVAL_SKIPPED.labels("error").inc()
+                self.logger.warning(f"Retrieval from namespace {namespace} failed: {str(e)}")
+
+        # Same embedding model and metric everywhere, so scores are comparable
+        merged: Dict[str, NodeWithScore] = {}
+        for nodes in results.values():
+            for node in nodes or []:
+                current = merged.get(node.node.node_id)
+                if current is None or (node.score or 0.0) > (current.score or 0.0):
+                    merged[node.node.node_id] = node
+        ranked = sorted(merged.values(), key=lambda node: node.score or 0.0, reverse=True)
+
+        self.logger.debug(
+            "Retrieved " + ", ".join(f"{namespace}={len(nodes or [])}" for namespace, nodes in results.items())
+        )
+        return ranked[:self._similarity_top_k]
+
+    def _search_inline(self, namespace: str, retriever: BaseRetriever, query_bundle: QueryBundle) -> Optional[List[NodeWithScore]]:
+        try:
+            return retriever.retrieve(query_bundle)
+        except Exception as e:
+            metrics.RETRIEVAL_SKIPPED.labels("error").inc()
+            self.logger.warning(f"Retrieval from namespace {namespace} failed: {str(e)}")
+            return None
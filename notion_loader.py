@@ -1,67 +1,210 @@
-from notion_client import Client
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
 from llama_index.readers.schema.base import Document
-from typing import List
+from typing import Dict, List, Optional
 import os
+import time
+import random
+import asyncio
+import httpx
 from datetime import datetime
 import logging
+import metrics
+
+# Blocks whose children are separate pages/databases rather than page content
+SKIP_CHILDREN = {"child_page", "child_database"}
+LIST_BLOCKS = {"bulleted_list_item", "numbered_list_item", "to_do"}
+
+
+class NotionRateLimiter:
+    # Spaces requests evenly at `rate` per second across every loader in the
+    # process (Notion's limit is per integration, about 3 req/s). A 429 pushes
+    # the next slot back for everyone, not just the request that hit it.
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                await asyncio.sleep(self._next - now)
+                now = time.monotonic()
+            self._next = max(now, self._next) + self.interval
+
+    def pause(self, seconds: float):
+        self._next = max(self._next, time.monotonic() + seconds)
+
+
+rate_limiter = NotionRateLimiter(float(os.getenv("NOTION_REQUESTS_PER_SECOND", "3")))
+
 
 class NotionDatabaseLoader:
     def __init__(self):
-        self.notion = Client(auth=os.getenv("NOTION_API_KEY"))
+        self.notion = AsyncClient(auth=os.getenv("NOTION_API_KEY"))
         self.database_id = os.getenv("NOTION_DATABASE_ID")
+        self.max_retries = int(os.getenv("NOTION_MAX_RETRIES", "5"))
+        # Pages fetched at once; the rate limiter still caps overall request rate
+        self.page_concurrency = int(os.getenv("NOTION_PAGE_CONCURRENCY", "3"))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.notion.aclose()
+
+    async def _call(self, fn, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            await rate_limiter.acquire()
+            try:
+                return await fn(**kwargs)
+            except HTTPResponseError as e:
+                if (e.status != 429 and e.status < 500) or attempt == self.max_retries:
+                    raise
+                retry_after = e.headers.get("retry-after")
+                delay = float(retry_after) if retry_after else self._backoff(attempt)
+                if e.status == 429:
+                    rate_limiter.pause(delay)
+            except (RequestTimeoutError, httpx.TransportError):
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            logging.warning(f"Notion request failed, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def _paginate(self, fn, **kwargs) -> List[dict]:
+        results = []
+        cursor = None
+        while True:
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            response = await self._call(fn, page_size=100, **kwargs)
+            results.extend(response.get("results", []))
+            if not response.get("has_more"):
+                return results
+            cursor = response.get("next_cursor")
+
+    async def _fetch_blocks(self, block_id: str) -> List[dict]:
+        # Full block tree; nested children are attached under "_children"
+        blocks = await self._paginate(self.notion.blocks.children.list, block_id=block_id)
+        parents = [block for block in blocks
+                   if block.get("has_children") and block["type"] not in SKIP_CHILDREN]
+        children = await asyncio.gather(*(self._fetch_blocks(block["id"]) for block in parents))
+        for block, block_children in zip(parents, children):
+            block["_children"] = block_children
+        return blocks
+
+    async def list_pages(self) -> List[dict]:
+        with metrics.stage("notion_list"):
+            return await self._paginate(self.notion.databases.query, database_id=self.database_id)
 
-    async def load_documents(self) -> List[Document]:
-        pages = self.notion.databases.query(database_id=self.database_id).get("results")
-        documents = []
-
-        for page in pages:
-            # Get page content
-            page_id = page["id"]
-            page_content = self.notion.blocks.children.list(block_id=page_id)
-            
-            # Extract text content from blocks
-            text_content = self._extract_text_from_blocks(page_content["results"])
-            
-            # Create metadata
-            metadata = {
-                "source": f"notion_page_{page_id}",
-                "created_time": page.get("created_time"),
-                "title": self._get_page_title(page),
-            }
-            
-            # Create document
-            doc = Document(
-                text=text_content,
-                metadata=metadata
-            )
-            documents.append(doc)
-
-        return documents
-
-    def _extract_text_from_blocks(self, blocks):
+    async def load_documents(
+        self,
+        known_edits: Optional[Dict[str, str]] = None,
+        pages: Optional[List[dict]] = None
+    ) -> List[Document]:
+        # known_edits maps page_id -> last_edited_time from the previous sync;
+        # pages that haven't been edited since are skipped without fetching blocks
+        if pages is None:
+            pages = await self.list_pages()
+        known_edits = known_edits or {}
+        changed = [page for page in pages if known_edits.get(page["id"]) != page.get("last_edited_time")]
+
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch(page):
+            async with semaphore:
+                return await self._page_document(page)
+
+        return list(await asyncio.gather(*(fetch(page) for page in changed)))
+
+    async def _page_document(self, page: dict) -> Document:
+        # Get page content
+        page_id = page["id"]
+        with metrics.stage("notion_fetch"):
+            blocks = await self._fetch_blocks(page_id)
+
+        # Extract text content from blocks
+        text_content = self._extract_text_from_blocks(blocks)
+
+        # Create metadata
+        metadata = {
+            "source": f"notion_page_{page_id}",
+            "created_time": page.get("created_time"),
+            "last_edited_time": page.get("last_edited_time"),
+            "title": self._get_page_title(page),
+            "page_id": page_id
+        }
+
+        # Create document. Keep sync bookkeeping out of the embedded/LLM text so
+        # an edit elsewhere on the page doesn't change every chunk's content hash.
+        return Document(
+            id_=page_id,
+            text=text_content,
+            metadata=metadata,
+            excluded_embed_metadata_keys=["last_edited_time", "page_id"],
+            excluded_llm_metadata_keys=["last_edited_time", "page_id"]
+        )
+
+    def _extract_text_from_blocks(self, blocks, depth: int = 0):
         text_content = []
-        
+
         for block in blocks:
-            block_type = block["type"]
-            if block_type == "paragraph":
-                text = block["paragraph"]["rich_text"]
-                if text:
-                    text_content.append(self._get_text_from_rich_text(text))
-            elif block_type == "heading_1":
-                text = block["heading_1"]["rich_text"]
-                if text:
-                    text_content.append(f"# {self._get_text_from_rich_text(text)}")
-            elif block_type == "heading_2":
-                text = block["heading_2"]["rich_text"]
-                if text:
-                    text_content.append(f"## {self._get_text_from_rich_text(text)}")
-            elif block_type == "heading_3":
-                text = block["heading_3"]["rich_text"]
-                if text:
-                    text_content.append(f"### {self._get_text_from_rich_text(text)}")
+            text = self._get_block_text(block, depth)
+            if text:
+                text_content.append(text)
+
+            # Tables render their rows themselves
+            if block["type"] != "table" and block.get("_children"):
+                nested = self._extract_text_from_blocks(block["_children"], depth + 1)
+                if nested:
+                    text_content.append(nested)
 
         return "\n\n".join(text_content)
 
+    def _get_block_text(self, block, depth: int) -> str:
+        block_type = block["type"]
+        data = block.get(block_type, {})
+        text = self._get_text_from_rich_text(data.get("rich_text", []))
+        indent = "  " * depth if block_type in LIST_BLOCKS else ""
+
+        if block_type == "heading_1":
+            return f"# {text}" if text else ""
+        elif block_type == "heading_2":
+            return f"## {text}" if text else ""
+        elif block_type == "heading_3":
+            return f"### {text}" if text else ""
+        elif block_type == "bulleted_list_item":
+            return f"{indent}- {text}" if text else ""
+        elif block_type == "numbered_list_item":
+            return f"{indent}1. {text}" if text else ""
+        elif block_type == "to_do":
+            checked = "x" if data.get("checked") else " "
+            return f"{indent}[{checked}] {text}" if text else ""
+        elif block_type == "quote":
+            return f"> {text}" if text else ""
+        elif block_type == "callout":
+            icon = (data.get("icon") or {}).get("emoji", "")
+            return f"{icon} {text}".strip()
+        elif block_type == "code":
+            code = "".join(item["plain_text"] for item in data.get("rich_text", []))
+            return f"```{data.get('language', '')}\n{code}\n```" if code else ""
+        elif block_type == "table":
+            rows = []
+            for row in block.get("_children", []):
+                if row["type"] == "table_row":
+                    cells = [self._get_text_from_rich_text(cell) for cell in row["table_row"]["cells"]]
+                    rows.append(" | ".join(cells))
+            return "\n".join(rows)
+        # paragraph, toggle and any other rich-text block
+        return text
+
     def _get_text_from_rich_text(self, rich_text):
         return " ".join([text["plain_text"] for text in rich_text])
 
@@ -72,31 +215,15 @@ class NotionDatabaseLoader:
                 return self._get_text_from_rich_text(title["title"])
         return "Untitled"
 
-    async def load_page(self, page_id: str) -> Document:
+    async def load_page(self, page_id: str, known_edit: Optional[str] = None) -> Optional[Document]:
+        # Returns None when the page's last_edited_time still equals known_edit
         try:
-            # Get page content
-            page = self.notion.pages.retrieve(page_id=page_id)
-            page_content = self.notion.blocks.children.list(block_id=page_id)
-            
-            # Extract text content from blocks
-            text_content = self._extract_text_from_blocks(page_content["results"])
-            
-            # Create metadata
-            metadata = {
-                "source": f"notion_page_{page_id}",
-                "created_time": page.get("created_time"),
-                "title": self._get_page_title(page),
-                "page_id": page_id
-            }
-            
-            # Create document
-            doc = Document(
-                text=text_content,
-                metadata=metadata
-            )
-            
-            return doc
-            
+            page = await self._call(self.notion.pages.retrieve, page_id=page_id)
+            if known_edit is not None and page.get("last_edited_time") == known_edit:
+                return None
+
+            return await self._page_document(page)
+
         except Exception as e:
             logging.error(f"Error loading Notion page {page_id}: {str(e)}")
             raise
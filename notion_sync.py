@@ -0,0 +1,147 @@
+# notion_sync.py
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from executors import ExecutorBusy
+
+
+@dataclass
+class _PendingPage:
+    first_seen: float
+    last_seen: float
+    events: int = 1
+
+
+class NotionSyncScheduler:
+    # Notion sends a burst of webhook events for one editing session. The
+    # webhook hands each event to submit() and returns straight away; events
+    # for the same page are coalesced until the page has been quiet for
+    # quiet_seconds (or max_wait_seconds after the first event), then the page
+    # is re-indexed once. A page is never synced twice at the same time (an
+    # event arriving mid-sync schedules one more sync after it), and at most
+    # max_concurrency pages sync at once.
+    def __init__(
+        self,
+        rag_manager=None,
+        quiet_seconds: float = None,
+        max_wait_seconds: float = None,
+        max_concurrency: int = None,
+        max_pending: int = None
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.rag_manager = rag_manager
+        self.quiet_seconds = quiet_seconds if quiet_seconds is not None else float(os.getenv("NOTION_SYNC_QUIET_SECONDS", "5"))
+        self.max_wait_seconds = max_wait_seconds or float(os.getenv("NOTION_SYNC_MAX_WAIT_SECONDS", "60"))
+        self.max_concurrency = max_concurrency or int(os.getenv("NOTION_SYNC_MAX_CONCURRENCY", "2"))
+        self.max_pending = max_pending or int(os.getenv("NOTION_SYNC_MAX_PENDING", "1000"))
+
+        self._pending: Dict[str, _PendingPage] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.running = 0
+
+        self.received = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.unchanged = 0
+        self.failed = 0
+
+    def start(self, rag_manager=None):
+        if rag_manager is not None:
+            self.rag_manager = rag_manager
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pending:
+            # Nothing is lost for good: the next sync of these pages compares
+            # against the stored last_edited_time and picks the edits up
+            self.logger.warning(f"⏹️ Dropped {len(self._pending)} pending Notion page syncs on shutdown")
+        self._pending.clear()
+        self._tasks.clear()
+
+    @property
+    def idle(self) -> bool:
+        return not self._tasks
+
+    def submit(self, page_id: str) -> bool:
+        # Returns True if the event joined a sync that was already pending
+        page_id = str(uuid.UUID(page_id))
+        now = time.monotonic()
+        self.received += 1
+
+        pending = self._pending.get(page_id)
+        if pending is not None:
+            pending.last_seen = now
+            pending.events += 1
+            self.coalesced += 1
+            return True
+
+        if len(self._pending) >= self.max_pending:
+            raise ExecutorBusy("notion_sync")
+        self._pending[page_id] = _PendingPage(first_seen=now, last_seen=now)
+        if page_id not in self._tasks:
+            self._tasks[page_id] = asyncio.create_task(self._run_page(page_id))
+        return False
+
+    async def _run_page(self, page_id: str):
+        try:
+            while page_id in self._pending:
+                pending = self._pending[page_id]
+                due = min(pending.last_seen + self.quiet_seconds, pending.first_seen + self.max_wait_seconds)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+
+                # Events from here on belong to the next sync of this page
+                del self._pending[page_id]
+                async with self._semaphore:
+                    await self._sync(page_id, pending.events)
+        finally:
+            self._tasks.pop(page_id, None)
+
+    async def _sync(self, page_id: str, events: int):
+        self.running += 1
+        try:
+            while True:
+                try:
+                    summary = await self.rag_manager.update_notion_page(page_id)
+                    break
+                except ExecutorBusy:
+                    # File ingests share the ingest executor; wait for a slot
+                    await asyncio.sleep(1)
+            if summary["pages"]:
+                self.processed += 1
+            else:
+                self.unchanged += 1
+            self.logger.info(f"✅ Notion page {page_id} synced after {events} events: {summary}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            self.logger.error(f"❌ Notion page {page_id} sync failed: {str(e)}")
+        finally:
+            self.running -= 1
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "running": self.running,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "processed": self.processed,
+            "unchanged": self.unchanged,
+            "failed": self.failed,
+            "quiet_seconds": self.quiet_seconds,
+            "max_concurrency": self.max_concurrency,
+        }
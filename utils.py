@@ -7,18 +7,42 @@ from llama_index import (
     VectorStoreIndex,
     LLMPredictor,
     PromptHelper,
-    SimpleDirectoryReader,
     StorageContext
 )
 from langchain_openai import ChatOpenAI
 from llama_index.vector_stores import PineconeVectorStore
-from typing import Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 import logging
-from llama_index.readers import download_loader
 from pinecone import (ServerlessSpec, Pinecone)
 import time
 import asyncio
+import threading
+import hashlib
+import uuid
+import httpx
+import openai
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FuturesTimeout
+from sqlalchemy import select
+from llama_index.schema import Document, MetadataMode, NodeRelationship, QueryBundle, TextNode
+from llama_index.query_engine import RetrieverQueryEngine
+from llama_index.response_synthesizers import get_response_synthesizer
 from notion_loader import NotionDatabaseLoader
+from executors import ExecutorBusy, query_executor, ingest_executor, retrieval_executor
+from embedding_cache import EmbeddingCache, CachedEmbedding
+from answer_cache import AnswerCache
+from context_assembly import ContextAssembler
+from multi_retriever import MultiNamespaceRetriever
+from hybrid_retriever import HybridRetriever
+from lexical_index import LexicalIndex
+from ingest_pipeline import IngestPipeline
+from document_parser import DocumentParser
+from llm_gateway import GatewayEmbedding, GatewayTransport
+from chunking import TokenChunker
+import metrics
+from local_vector_store import LocalVectorIndex, LocalVectorStore
+from database import AsyncSessionLocal
+from models import NotionPageState
 load_dotenv()
 
 class PineconeRAGManager:
@@ -26,6 +50,116 @@ class PineconeRAGManager:
         # Initialize logging
         self.logger = logging.getLogger(__name__)
         
+        # "pinecone" (default) or "local" for the in-process NumPy store
+        self.vector_backend = os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+        self.local_index = None
+        self.pinecone_index = None
+        if self.vector_backend == "local":
+            self.local_index = LocalVectorIndex()
+        else:
+            self._init_pinecone()
+
+        # All OpenAI traffic goes through a gateway per API (rate budgets,
+        # concurrency cap, retries, deadlines, optional hedging), so the
+        # clients' own retries (and llama_index's around embeddings) are off
+        self.llm_gateway = GatewayTransport.from_env("llm", "OPENAI_LLM")
+        self.embedding_gateway = GatewayTransport.from_env("embedding", "OPENAI_EMBED")
+
+        # Initialize LLM
+        self.llm_predictor = LLMPredictor(
+            llm=ChatOpenAI(
+                temperature=0,
+                model_name="gpt-4",
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.Client(transport=self.llm_gateway),
+                max_retries=0
+            )
+        )
+        
+        # Chunks we've embedded before are served from a local cache
+        self.embedding_cache = EmbeddingCache()
+        self.embed_model = CachedEmbedding(
+            GatewayEmbedding(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.Client(transport=self.embedding_gateway),
+                max_retries=0
+            ),
+            self.embedding_cache
+        )
+
+        # Answers to repeated or near-identical questions, per namespace
+        self.answer_cache = AnswerCache()
+
+        # One chunker (CHUNK_SIZE/CHUNK_OVERLAP tokens, 256/50 by default) for
+        # every ingestion path and for anything LlamaIndex chunks itself
+        self.chunker = TokenChunker()
+        self.service_context = ServiceContext.from_defaults(
+            llm_predictor=self.llm_predictor,
+            embed_model=self.embed_model,
+            node_parser=self.chunker
+        )
+
+        self.notion_namespace = "notion_content"  # Single namespace for all Notion data
+
+        # Namespaces searched for every query, "{chat_id}" filled in per chat.
+        # They're searched concurrently and merged into one top-k; a namespace
+        # slower than RETRIEVAL_NAMESPACE_TIMEOUT is left out of that answer.
+        self.retrieval_namespaces = [
+            template.strip()
+            for template in os.getenv("RETRIEVAL_NAMESPACES", "chat_{chat_id},notion_content").split(",")
+            if template.strip()
+        ]
+        self.retrieval_timeout = float(os.getenv("RETRIEVAL_NAMESPACE_TIMEOUT", "2"))
+        self.similarity_top_k = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+        self.retrieval_executor = retrieval_executor
+
+        # Local BM25 index over the same chunks, fused with the vector hits
+        # (reciprocal-rank fusion over LEXICAL_FUSION_CANDIDATES from each).
+        # Off by default: it's local disk state written only by the process
+        # that ingests, so it needs a single replica or a shared volume.
+        # With LEXICAL_FAST_PATH=1 a query whose best lexical hit scores at
+        # least LEXICAL_FAST_PATH_SCORE and LEXICAL_FAST_PATH_RATIO times the
+        # runner-up skips the query embedding and the vector search entirely.
+        self.lexical_index = LexicalIndex() if os.getenv("LEXICAL_SEARCH", "0") == "1" else None
+        self.fusion_candidates = int(os.getenv("LEXICAL_FUSION_CANDIDATES", "10"))
+        self.rrf_k = float(os.getenv("LEXICAL_RRF_K", "60"))
+        self.lexical_fast_path_score = (
+            float(os.getenv("LEXICAL_FAST_PATH_SCORE", "0.5")) if os.getenv("LEXICAL_FAST_PATH", "0") == "1" else None
+        )
+        self.lexical_fast_path_ratio = float(os.getenv("LEXICAL_FAST_PATH_RATIO", "2"))
+
+        # Uploads are extracted and chunked in worker processes, started now
+        # so the first upload doesn't pay for it
+        self.document_parser = DocumentParser(self.chunker)
+        self.document_parser.start()
+
+        # Trims retrieved chunks to a token budget before they reach the LLM
+        self.context_assembler = ContextAssembler()
+
+        # Blocking LlamaIndex/Pinecone/OpenAI work runs here, off the event loop.
+        # Separate pools so a large ingest can't starve chat traffic.
+        self.query_executor = query_executor
+        self.ingest_executor = ingest_executor
+
+        # Batched, pipelined embedding + upsert for every ingestion path
+        self.pipeline = IngestPipeline(self.embed_model, self.ingest_executor, self.lexical_index)
+
+        # Long-lived index objects (least recently used dropped past
+        # INDEX_CACHE_SIZE namespaces) and response synthesizers, reused across
+        # requests. invalidate_namespace() drops an index whenever we write to it.
+        self._cache_lock = threading.Lock()
+        self._index_cache: "OrderedDict[str, VectorStoreIndex]" = OrderedDict()
+        self._index_cache_size = int(os.getenv("INDEX_CACHE_SIZE", "256"))
+        self._synthesizers = {}
+
+        # Whether each namespace holds any vectors, checked at most once per
+        # NAMESPACE_CHECK_TTL_SECONDS. Cached answers are keyed on just the
+        # populated namespaces, so chats without uploads of their own share
+        # answers drawn from the shared (Notion) content.
+        self._populated: "OrderedDict[str, Tuple[bool, float]]" = OrderedDict()
+        self._populated_ttl = float(os.getenv("NAMESPACE_CHECK_TTL_SECONDS", "60"))
+
+    def _init_pinecone(self):
         # Initialize Pinecone
         self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
         self.index_name = os.getenv("PINECONE_INDEX_NAME", "rag-chatbot")
@@ -47,226 +181,586 @@ class PineconeRAGManager:
                         ),
                         deletion_protection="disabled"
                     )
-                    # Wait for index to be ready
+                    # Wait for index to be ready, but not forever: startup
+                    # retries the whole initialisation if this gives up
+                    deadline = time.monotonic() + float(os.getenv("PINECONE_READY_TIMEOUT", "120"))
                     while not self.pc.describe_index(self.index_name).status['ready']:
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"Pinecone index {self.index_name} not ready")
                         time.sleep(1)
                     
                     self.pinecone_index = self.pc.Index(self.index_name)
                 except Exception as create_error:
                     self.logger.error(f"Failed to create index: {str(create_error)}")
                     raise
-        
-        # Initialize LLM
-        self.llm_predictor = LLMPredictor(
-            llm=ChatOpenAI(
-                temperature=0,
-                model_name="gpt-4",
-                api_key=os.getenv("OPENAI_API_KEY")
-            )
-        )
-        
-        # Set up service context with more aggressive chunking
-        self.service_context = ServiceContext.from_defaults(
-            llm_predictor=self.llm_predictor,
-            chunk_size=256,
-            chunk_overlap=50
-        )
 
-        self.notion_namespace = "notion_content"  # Single namespace for all Notion data
+    def check_vector_store(self):
+        # Cheap round trip used by /ready; raises if the store is unreachable
+        if self.local_index is not None:
+            self.local_index.describe()
+        elif self.pinecone_index is None:
+            raise RuntimeError(f"Pinecone index {self.index_name} unavailable")
+        else:
+            self.pinecone_index.describe_index_stats()
 
     def get_namespace(self, chat_id: int) -> str:
         return f"chat_{chat_id}"
 
-    def get_vector_store(self) -> PineconeVectorStore:
+    def _make_vector_store(self, namespace: str):
+        if self.local_index is not None:
+            return LocalVectorStore(self.local_index, namespace=namespace)
         return PineconeVectorStore(
             pinecone_index=self.pinecone_index,
-            namespace=self.notion_namespace
+            namespace=namespace
         )
 
-    def get_index(self, chat_id: int) -> Optional[VectorStoreIndex]:
+    def get_vector_store(self, chat_id: Optional[int] = None):
+        # A chat's own uploads live in its namespace; Notion content is shared
+        if chat_id is not None:
+            return self._make_vector_store(self.get_namespace(chat_id))
+        return self._make_vector_store(self.notion_namespace)
+
+    def get_retrieval_namespaces(self, chat_id: int) -> Tuple[str, ...]:
+        namespaces = (template.format(chat_id=chat_id) for template in self.retrieval_namespaces)
+        return tuple(dict.fromkeys(namespaces))
+
+    def _namespace_has_vectors(self, namespace: str) -> bool:
+        if self.local_index is not None:
+            return self.local_index.has_namespace(namespace) and len(self.local_index.namespace(namespace)) > 0
+        listing = self.pinecone_index.list_paginated(namespace=namespace, limit=1)
+        return bool(listing.vectors)
+
+    def _check_populated(self, namespace: str) -> bool:
+        # One round trip, remembered for _populated_ttl
         try:
-            vector_store = self.get_vector_store()
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
-            
-            return VectorStoreIndex.from_vector_store(
-                vector_store,
-                storage_context=storage_context,
-                service_context=self.service_context,
-                use_async=True  # Add async support
-            )
+            populated = self._namespace_has_vectors(namespace)
         except Exception as e:
-            self.logger.error(f"Error getting index for chat {chat_id}: {str(e)}")
-            return None
+            # Unknown counts as populated: the answer is cached per namespace as before
+            self.logger.warning(f"Could not check namespace {namespace} for vectors: {str(e)}")
+            return True
 
-    async def ingest_document(self, file_path: str, chat_id: int):
-        try:
-            start_time = time.perf_counter()
-            
-            # Load documents based on file type
-            if file_path.lower().endswith('.txt'):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                
-                from llama_index.schema import Document
-                document = Document(text=text)
-                
-                from llama_index.node_parser import SimpleNodeParser
-                parser = SimpleNodeParser.from_defaults(
-                    chunk_size=256,
-                    chunk_overlap=50,
-                    include_metadata=True,
-                    include_prev_next_rel=True
-                )
-                
-                nodes = parser.get_nodes_from_documents([document])
-                
-                # Create vector store with chat-specific namespace
-                vector_store = self.get_vector_store(chat_id)
+        with self._cache_lock:
+            self._populated[namespace] = (populated, time.monotonic())
+            self._populated.move_to_end(namespace)
+            while len(self._populated) > self._index_cache_size * 16:
+                self._populated.popitem(last=False)
+        return populated
+
+    def get_cache_scope(self, namespaces: Tuple[str, ...]) -> Tuple[str, ...]:
+        # The namespaces an answer can depend on. Empty ones are left out, so
+        # a chat with no uploads hits the same cache entries as every other.
+        # Namespaces not checked recently are checked concurrently on the
+        # retrieval executor; one not answered within the retrieval timeout
+        # counts as populated (its check still finishes and is remembered).
+        now = time.monotonic()
+        populated, unknown = {}, []
+        with self._cache_lock:
+            for namespace in namespaces:
+                cached = self._populated.get(namespace)
+                if cached is not None and now - cached[1] < self._populated_ttl:
+                    populated[namespace] = cached[0]
+                else:
+                    unknown.append(namespace)
+
+        futures = {}
+        for namespace in unknown:
+            if self.local_index is not None:
+                populated[namespace] = self._check_populated(namespace)
+                continue
+            try:
+                futures[namespace] = self.retrieval_executor.submit(self._check_populated, namespace)
+            except ExecutorBusy:
+                populated[namespace] = True
+        deadline = time.monotonic() + self.retrieval_timeout
+        for namespace, future in futures.items():
+            try:
+                populated[namespace] = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeout:
+                populated[namespace] = True
+        return tuple(namespace for namespace in namespaces if populated[namespace])
+
+    def _store_answer(self, namespaces: Tuple[str, ...], scope: Tuple[str, ...], query: str, embedding, text: str, version):
+        # A namespace left out of the scope may have been written to since,
+        # and fed this answer; then it mustn't be shared with chats that can't
+        # see that content
+        if any(self._check_populated(namespace) for namespace in namespaces if namespace not in scope):
+            return
+        self.answer_cache.put(scope, query, embedding, text, version)
+
+    def _get_cached_index(self, namespace: str) -> VectorStoreIndex:
+        with self._cache_lock:
+            index = self._index_cache.get(namespace)
+            if index is not None:
+                self._index_cache.move_to_end(namespace)
+            else:
+                vector_store = self._make_vector_store(namespace)
                 storage_context = StorageContext.from_defaults(vector_store=vector_store)
-                
-                # Create index synchronously since we're in an async context
-                index = VectorStoreIndex.from_documents(
-                    [document],
+
+                index = VectorStoreIndex.from_vector_store(
+                    vector_store,
                     storage_context=storage_context,
                     service_context=self.service_context,
-                    show_progress=True
+                    use_async=True  # Add async support
                 )
-                
-            else:
-                # Handle other file types
-                if file_path.lower().endswith('.pdf'):
-                    PDFReader = download_loader("PDFReader")
-                    loader = PDFReader()
-                    documents = loader.load_data(file=file_path)
-                elif file_path.lower().endswith('.docx'):
-                    DocxReader = download_loader("DocxReader")
-                    loader = DocxReader()
-                    documents = loader.load_data(file=file_path)
-                else:
-                    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+                self._index_cache[namespace] = index
+                while len(self._index_cache) > self._index_cache_size:
+                    self._index_cache.popitem(last=False)
+            return index
 
-                vector_store = self.get_vector_store()
-                storage_context = StorageContext.from_defaults(vector_store=vector_store)
-                
-                # Create index synchronously
-                index = VectorStoreIndex.from_documents(
-                    documents,
-                    storage_context=storage_context,
+    def get_index(self, chat_id: int) -> Optional[VectorStoreIndex]:
+        try:
+            return self._get_cached_index(self.notion_namespace)
+        except Exception as e:
+            self.logger.error(f"Error getting index for chat {chat_id}: {str(e)}")
+            return None
+
+    def _get_synthesizer(self, streaming: bool):
+        with self._cache_lock:
+            synthesizer = self._synthesizers.get(streaming)
+            if synthesizer is None:
+                synthesizer = self._synthesizers[streaming] = get_response_synthesizer(
                     service_context=self.service_context,
-                    show_progress=True
+                    streaming=streaming
+                )
+            return synthesizer
+
+    def get_query_engine(self, namespaces: Tuple[str, ...], similarity_top_k: int = 3, streaming: bool = True):
+        # Built per query from cached indexes and synthesizer; the per-namespace
+        # retrievers are thin wrappers, so this costs next to nothing
+        candidates = max(similarity_top_k, self.fusion_candidates) if self.lexical_index is not None else similarity_top_k
+        retriever = MultiNamespaceRetriever(
+            {
+                namespace: self._get_cached_index(namespace).as_retriever(similarity_top_k=candidates)
+                for namespace in namespaces
+            },
+            self.retrieval_executor,
+            similarity_top_k=candidates,
+            timeout=self.retrieval_timeout,
+            embed_model=self.embed_model
+        )
+        if self.lexical_index is not None:
+            retriever = HybridRetriever(
+                retriever,
+                self.lexical_index,
+                namespaces,
+                similarity_top_k=similarity_top_k,
+                candidates=candidates,
+                rrf_k=self.rrf_k,
+                fast_path_score=self.lexical_fast_path_score,
+                fast_path_ratio=self.lexical_fast_path_ratio
+            )
+        return RetrieverQueryEngine(
+            retriever=retriever,
+            response_synthesizer=self._get_synthesizer(streaming),
+            node_postprocessors=[self.context_assembler]
+        )
+
+    def invalidate_namespace(self, namespace: str):
+        with self._cache_lock:
+            self._index_cache.pop(namespace, None)
+            # Written to, so its answers are no longer shared with empty chats
+            self._populated[namespace] = (True, time.monotonic())
+            self._populated.move_to_end(namespace)
+        # Bumps the namespace version so answers generated before the write are dropped
+        self.answer_cache.invalidate(namespace)
+        self.logger.info(f"♻️ Invalidated cached index for namespace {namespace}")
+
+    def _link_neighbours(self, nodes: List[TextNode]):
+        for idx, node in enumerate(nodes):
+            node.relationships.pop(NodeRelationship.PREVIOUS, None)
+            node.relationships.pop(NodeRelationship.NEXT, None)
+            if idx > 0:
+                node.relationships[NodeRelationship.PREVIOUS] = nodes[idx - 1].as_related_node_info()
+            if idx < len(nodes) - 1:
+                node.relationships[NodeRelationship.NEXT] = nodes[idx + 1].as_related_node_info()
+
+    async def ingest_document(
+        self,
+        file_path: str,
+        chat_id: int,
+        progress=None,
+        file_name: str = None,
+        source_id: str = None
+    ) -> int:
+        # progress is an optional async callback, awaited with each stage name
+        # (parsing, embedding, upserting) as ingestion reaches it. file_name
+        # is the uploaded name, recorded on the chunks instead of file_path's;
+        # source_id prefixes the chunk IDs (see DocumentParser.iter_nodes).
+        try:
+            start_time = time.perf_counter()
+
+            try:
+                chunks = await self.pipeline.run(
+                    self.document_parser.iter_nodes(file_path, file_name, source_id),
+                    self.get_vector_store(chat_id),
+                    progress=progress
                 )
+            finally:
+                # Even a partial write changes what the namespace returns
+                self.invalidate_namespace(self.get_namespace(chat_id))
 
             duration = time.perf_counter() - start_time
-            self.logger.info(f"Index creation took {duration:.2f} seconds for chat {chat_id}")
-            
-            remaining_time = max(5 - duration, 0)
-            if remaining_time > 0:
-                await asyncio.sleep(remaining_time)
-                
-            return index
+            self.logger.info(f"Index creation took {duration:.2f} seconds for chat {chat_id} ({chunks} chunks)")
+
+            return chunks
 
         except Exception as e:
             self.logger.error(f"Error ingesting document for chat {chat_id}: {str(e)}")
             raise
 
-    async def generate_response(self, query: str, chat_id: int) -> str:
-        try:
-            index = self.get_index(chat_id)
-            if not index:
-                return "No knowledge base found. Please upload some documents first."
+    def _cached_answer(self, query: str, namespaces: Tuple[str, ...], retriever):
+        # Returns (answer, embedding, version). The version is read before
+        # retrieval so an ingest that lands mid-query discards our answer.
+        version = self.answer_cache.version(namespaces)
+        if not self.answer_cache.enabled:
+            return None, None, version
+
+        answer = self.answer_cache.get_text(namespaces, query)
+        if answer is not None:
+            return answer, None, version
+
+        # A query the lexical fast path answers never needs its embedding, so
+        # it skips the semantic lookup too (and isn't stored for one)
+        if isinstance(retriever, HybridRetriever) and retriever.fast_path(query):
+            return None, None, version
 
-            # Log the query
-            self.logger.info(f"Query for chat {chat_id}: {query}")
+        # Embedded once here and handed to the retriever, so a miss costs nothing extra
+        with metrics.stage("query_embedding"):
+            embedding = self.embed_model.get_query_embedding(query)
+        return self.answer_cache.get(namespaces, embedding), embedding, version
 
-            query_engine = index.as_query_engine(
-                similarity_top_k=3,
-                streaming=True
+    def _query(self, query: str, chat_id: int, query_engine, embedding: Optional[List[float]] = None):
+        query_bundle = QueryBundle(query, embedding=embedding)
+        with metrics.stage("retrieval"):
+            nodes = query_engine.retrieve(query_bundle)
+        response = query_engine.synthesize(query_bundle, nodes)
+
+        # Scores and ids only: chunk text and the query are user content
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                f"Retrieved {len(nodes)} chunks for chat {chat_id}: "
+                + ", ".join(f"{node.node.node_id}={node.score:.3f}" for node in nodes if node.score is not None)
             )
-            
-            response = query_engine.query(query)
-            
-            # Log the retrieved chunks
-            if hasattr(response, 'source_nodes'):
-                if not response.source_nodes:  # Check if there are any retrieved chunks
-                    return "No relevant information found in the knowledge base."
-                    
-                self.logger.info(f"Retrieved chunks for chat {chat_id}:")
-                for idx, node in enumerate(response.source_nodes):
-                    self.logger.info(f"Chunk {idx + 1}:")
-                    self.logger.info(f"Score: {node.score}")
-                    self.logger.info(f"Content: {node.node.text}")
-                    self.logger.info("---")
-            
-            response_text = str(response)
-            if not response_text.strip():  # Check if response is empty or just whitespace
-                return "I couldn't generate a meaningful response from the available information."
-            
-            return response_text
 
+        return response
+
+    def _generate_response_sync(self, query: str, chat_id: int) -> str:
+        # Same path as streaming, so both get the answer cache and LLM timings
+        response_text = "".join(self._iter_response_tokens(query, chat_id))
+        if not response_text.strip():  # Check if response is empty or just whitespace
+            return "I couldn't generate a meaningful response from the available information."
+
+        return response_text
+
+    async def generate_response(self, query: str, chat_id: int) -> str:
+        try:
+            return await self.query_executor.run(self._generate_response_sync, query, chat_id)
+
+        except ExecutorBusy:
+            raise
+        except (openai.RateLimitError, openai.APITimeoutError) as e:
+            # The gateway already retried until the deadline; tell the client
+            # to come back (503 + Retry-After) instead of answering with an error
+            self.logger.warning(f"⏳ OpenAI unavailable for chat {chat_id}: {str(e)}")
+            raise ExecutorBusy("llm") from e
         except Exception as e:
             self.logger.error(f"Error generating response for chat {chat_id}: {str(e)}")
             return f"An error occurred while generating the response: {str(e)}"
 
+    def _iter_response_tokens(self, query: str, chat_id: int) -> Iterator[str]:
+        namespaces = self.get_retrieval_namespaces(chat_id)
+        scope = self.get_cache_scope(namespaces) if self.answer_cache.enabled else namespaces
+        # Built before the cache lookup, which asks its retriever about the lexical fast path
+        try:
+            query_engine = self.get_query_engine(namespaces, similarity_top_k=self.similarity_top_k, streaming=True)
+        except Exception as e:
+            self.logger.error(f"Error getting index for chat {chat_id}: {str(e)}")
+            yield "No knowledge base found. Please upload some documents first."
+            return
+
+        answer, embedding, version = self._cached_answer(query, scope, query_engine.retriever)
+        if answer is not None:
+            self.logger.info(f"⚡ Answer cache hit for chat {chat_id}")
+            yield answer
+            return
+
+        response = self._query(query, chat_id, query_engine, embedding)
+
+        if hasattr(response, 'source_nodes') and not response.source_nodes:
+            yield "No relevant information found in the knowledge base."
+            return
+
+        tokens = []
+        started = time.perf_counter()
+        for token in response.response_gen:
+            if token:
+                if not tokens:
+                    metrics.observe("llm_first_token", time.perf_counter() - started, started)
+                tokens.append(token)
+                yield token
+        metrics.observe("llm_total", time.perf_counter() - started, started)
+
+        if not tokens:
+            yield "I couldn't generate a meaningful response from the available information."
+            return
+
+        # Only reached when the client read the whole answer
+        response_text = "".join(tokens)
+        metrics.LLM_TOKENS.labels("completion").inc(self.context_assembler.count_tokens(response_text))
+        if embedding is not None and response_text.strip():
+            if scope == namespaces:
+                self.answer_cache.put(scope, query, embedding, response_text, version)
+            else:
+                # Its namespace checks cost round trips, so they happen after
+                # the response rather than inside it
+                try:
+                    self.retrieval_executor.submit(
+                        self._store_answer, namespaces, scope, query, embedding, response_text, version
+                    )
+                except ExecutorBusy:
+                    pass
+
+    def stream_response(self, query: str, chat_id: int) -> AsyncIterator[str]:
+        # Retrieval and the token generator are synchronous, so run them on the
+        # query executor and hand tokens back to the event loop through a queue.
+        # Admission happens here, before any response bytes are sent, so a full
+        # executor raises ExecutorBusy to the caller instead of mid-stream.
+        # Closing the iterator (client disconnect) stops the worker at the next token.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def produce():
+            try:
+                for token in self._iter_response_tokens(query, chat_id):
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, token)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        producer = self.query_executor.submit(produce)
+        return self._drain_tokens(queue, done, stop, producer, chat_id)
+
+    async def _drain_tokens(self, queue, done, stop, producer, chat_id: int) -> AsyncIterator[str]:
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    # Raised rather than streamed as content, so the caller
+                    # can report it and not save it as the answer
+                    if isinstance(item, (openai.RateLimitError, openai.APITimeoutError)):
+                        self.logger.warning(f"⏳ OpenAI unavailable for chat {chat_id}: {str(item)}")
+                        raise ExecutorBusy("llm") from item
+                    self.logger.error(f"Error streaming response for chat {chat_id}: {str(item)}")
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            if producer.done():
+                producer.result()
+
+    async def _load_page_states(self, page_ids: Optional[List[str]] = None) -> Dict[str, NotionPageState]:
+        async with AsyncSessionLocal() as session:
+            query = select(NotionPageState)
+            if page_ids is not None:
+                query = query.where(NotionPageState.page_id.in_(page_ids))
+            result = await session.execute(query)
+            return {state.page_id: state for state in result.scalars().all()}
+
+    async def _save_page_state(self, page_id: str, last_edited_time: Optional[str], chunk_ids: List[str]):
+        async with AsyncSessionLocal() as session:
+            await session.merge(NotionPageState(
+                page_id=page_id,
+                last_edited_time=last_edited_time,
+                chunk_ids=chunk_ids
+            ))
+            await session.commit()
+
+    async def _delete_page_state(self, page_id: str):
+        async with AsyncSessionLocal() as session:
+            state = await session.get(NotionPageState, page_id)
+            if state is not None:
+                await session.delete(state)
+                await session.commit()
+
+    def _split_sections(self, text: str) -> List[str]:
+        # Break a page at its headings so each section is chunked on its own
+        sections, current = [], []
+        for block in text.split("\n\n"):
+            if block.startswith("#") and current:
+                sections.append("\n\n".join(current))
+                current = []
+            current.append(block)
+        if current:
+            sections.append("\n\n".join(current))
+        return [section for section in sections if section.strip()]
+
+    def _page_nodes(self, document) -> List[TextNode]:
+        # Chunk per section so an edit only shifts chunk boundaries inside its
+        # own section, then give every chunk an ID derived from its content.
+        # Unchanged chunks keep their IDs across edits and are never re-upserted.
+        page_id = document.metadata["page_id"]
+        sections = [
+            Document(
+                id_=page_id,
+                text=section,
+                metadata=document.metadata,
+                excluded_embed_metadata_keys=document.excluded_embed_metadata_keys,
+                excluded_llm_metadata_keys=document.excluded_llm_metadata_keys
+            )
+            for section in self._split_sections(document.text)
+        ]
+        # All sections in one call, so the page is tokenised in one batch
+        nodes = self.chunker.get_nodes_from_documents(sections)
+
+        occurrences = {}
+        for node in nodes:
+            content = node.get_content(metadata_mode=MetadataMode.EMBED)
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+            count = occurrences.get(digest, 0)
+            occurrences[digest] = count + 1
+            node.id_ = f"{page_id}:{digest}" if count == 0 else f"{page_id}:{digest}:{count}"
+
+        # Relink neighbours across sections now that IDs are final
+        self._link_neighbours(nodes)
+
+        return nodes
+
+    def _delete_vectors(self, ids: List[str], namespace: str):
+        if self.lexical_index is not None:
+            self.lexical_index.delete(namespace, ids)
+        if self.local_index is not None:
+            self.local_index.namespace(namespace).delete(ids)
+            return
+        for start in range(0, len(ids), 1000):
+            self.pinecone_index.delete(ids=ids[start:start + 1000], namespace=namespace)
+
+    def _drop_legacy_page_namespace(self, page_id: str):
+        # Earlier versions wrote each page to its own notion_page_{id} namespace
+        if self.local_index is not None:
+            return
+        try:
+            self.pinecone_index.delete(delete_all=True, namespace=f"notion_page_{page_id}")
+        except Exception as e:
+            self.logger.debug(f"No legacy namespace for Notion page {page_id}: {str(e)}")
+
+    def _backfill_lexical(self, nodes: List[TextNode]):
+        # Chunks embedded before the lexical index existed (or before it was
+        # wiped) are indexed here without being re-embedded
+        missing = self.lexical_index.missing(self.notion_namespace, [node.node_id for node in nodes])
+        if missing:
+            self.lexical_index.add(self.notion_namespace, [node for node in nodes if node.node_id in missing])
+            self.logger.info(f"🔤 Added {len(missing)} existing Notion chunks to the lexical index")
+
+    async def _sync_notion_documents(self, documents, states: Dict[str, NotionPageState]) -> dict:
+        summary = {"pages": 0, "upserted": 0, "deleted": 0}
+        changed, unchanged, stale, page_chunks = [], [], [], {}
+
+        for document in documents:
+            page_id = document.metadata["page_id"]
+            state = states.get(page_id)
+            if state is None:
+                await self.ingest_executor.run(self._drop_legacy_page_namespace, page_id)
+
+            nodes = await self.ingest_executor.run(self._page_nodes, document)
+            chunk_ids = [node.node_id for node in nodes]
+            known = set(state.chunk_ids) if state else set()
+
+            page_changed = [node for node in nodes if node.node_id not in known]
+            unchanged.extend(node for node in nodes if node.node_id in known)
+            page_stale = sorted(known - set(chunk_ids))
+            changed.extend(page_changed)
+            stale.extend(page_stale)
+            page_chunks[page_id] = (document.metadata.get("last_edited_time"), chunk_ids)
+            self.logger.info(f"🔄 Notion page {page_id}: {len(page_changed)} changed, {len(page_stale)} stale chunks")
+
+        try:
+            # All pages' changed chunks go through one pipeline run so
+            # embedding and upserting overlap across pages too
+            if changed:
+                summary["upserted"] = await self.pipeline.run(changed, self.get_vector_store(), source="notion")
+            if stale:
+                await self.ingest_executor.run(self._delete_vectors, stale, self.notion_namespace)
+                summary["deleted"] = len(stale)
+            if unchanged and self.lexical_index is not None:
+                await self.ingest_executor.run(self._backfill_lexical, unchanged)
+        finally:
+            if changed or stale:
+                self.invalidate_namespace(self.notion_namespace)
+
+        # Record state only once vectors are written; a failed sync is
+        # simply redone next time since chunk IDs are deterministic
+        for page_id, (last_edited_time, chunk_ids) in page_chunks.items():
+            await self._save_page_state(page_id, last_edited_time, chunk_ids)
+            summary["pages"] += 1
+        return summary
+
     async def ingest_notion_database(self, chat_id: int):
         try:
             start_time = time.perf_counter()
             
-            # Load documents from Notion
-            notion_loader = NotionDatabaseLoader()
-            documents = await notion_loader.load_documents()
-            
-            # Create vector store and index using notion_namespace
-            vector_store = self.get_vector_store()  # This now uses notion_namespace
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
+            states = await self._load_page_states()
+            known_edits = {page_id: state.last_edited_time for page_id, state in states.items()}
+            if states and self.lexical_index is not None and self.lexical_index.is_empty(self.notion_namespace):
+                # Reload every page once to fill the lexical index; unchanged
+                # chunks keep their IDs, so nothing is re-embedded
+                self.logger.info(f"🔤 Lexical index empty, reloading all {len(states)} Notion pages to backfill it")
+                known_edits = {}
+
+            # Load only pages edited since the last sync
+            async with NotionDatabaseLoader() as notion_loader:
+                pages = await notion_loader.list_pages()
+                documents = await notion_loader.load_documents(known_edits=known_edits, pages=pages)
             
-            index = VectorStoreIndex(
-                documents,
-                storage_context=storage_context,
-                service_context=self.service_context,
-                # use_async=True
-            )
+            summary = await self._sync_notion_documents(documents, states)
+
+            # Pages that left the database take their vectors with them
+            live_ids = {page["id"] for page in pages}
+            for page_id, state in states.items():
+                if page_id not in live_ids:
+                    await self.ingest_executor.run(self._delete_vectors, list(state.chunk_ids), self.notion_namespace)
+                    await self._delete_page_state(page_id)
+                    summary["deleted"] += len(state.chunk_ids)
+                    self.invalidate_namespace(self.notion_namespace)
 
             duration = time.perf_counter() - start_time
-            self.logger.info(f"Notion database ingestion took {duration:.2f} seconds for chat {chat_id}")
-            
-            remaining_time = max(5 - duration, 0)
-            if remaining_time > 0:
-                await asyncio.sleep(remaining_time)
-                
-            return index
+            self.logger.info(f"Notion database ingestion took {duration:.2f} seconds for chat {chat_id}: {summary}")
+
+            return summary
 
         except Exception as e:
             self.logger.error(f"Error ingesting Notion database for chat {chat_id}: {str(e)}")
             raise
 
-    async def update_notion_page(self, page_id: str):
+    async def update_notion_page(self, page_id: str, force: bool = False):
         try:
-            namespace = f"notion_page_{page_id}"
-            logging.info(f"🔄 Updating/creating namespace: {namespace}")
-            
-            # Load updated page content
-            notion_loader = NotionDatabaseLoader()
-            updated_document = await notion_loader.load_page(page_id)
-            
-            # Create new vectors in page-specific namespace
-            vector_store = PineconeVectorStore(
-                pinecone_index=self.pinecone_index,
-                namespace=namespace
-            )
-            storage_context = StorageContext.from_defaults(vector_store=vector_store)
-            
-            # Create index synchronously to avoid event loop issues
-            index = VectorStoreIndex.from_documents(
-                [updated_document],
-                storage_context=storage_context,
-                service_context=self.service_context,
-                # show_progress=True
-            )
+            logging.info(f"🔄 Syncing Notion page {page_id} into namespace: {self.notion_namespace}")
+
+            # Notion accepts IDs with or without dashes but always returns them dashed
+            page_id = str(uuid.UUID(page_id))
+            states = await self._load_page_states([page_id])
+            known_edit = None
+            if not force and page_id in states:
+                known_edit = states[page_id].last_edited_time
+
+            # Load updated page content, unless it hasn't changed since the last sync
+            async with NotionDatabaseLoader() as notion_loader:
+                updated_document = await notion_loader.load_page(page_id, known_edit=known_edit)
+            if updated_document is None:
+                self.logger.info(f"⏭️ Notion page {page_id} unchanged since last sync")
+                return {"pages": 0, "upserted": 0, "deleted": 0}
+
+            summary = await self._sync_notion_documents([updated_document], states)
             
-            self.logger.info(f"✅ Updated vectors for Notion page {page_id} in namespace {namespace}")
-            return index
+            self.logger.info(f"✅ Updated vectors for Notion page {page_id} in namespace {self.notion_namespace}")
+            return summary
             
         except Exception as e:
             self.logger.error(f"❌ Error updating Notion content: {str(e)}")
             raise
-